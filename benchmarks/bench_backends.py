@@ -0,0 +1,213 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from benchmarks.bench_oracle import (  # noqa: E402
+    PROMPT_PATH,
+    load_prompts,
+    machine_info
+)
+from jackbot.answer_cache import AnswerCache  # noqa: E402
+from jackbot.generation import ModelBackend  # noqa: E402
+from jackbot.metrics import percentiles  # noqa: E402
+from jackbot.orcale import (  # noqa: E402
+    AiTextOracle,
+    InferenceMode,
+    PromptAnswerMethod
+)
+
+
+RESULTS_PATH = "results/bench_backends.json"
+REQUESTS = 16
+RANK_BUDGET = 600.0
+
+
+def resident_mb() -> float:
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def async_run_backend(
+    backend: ModelBackend,
+    model_folder: str,
+    prompts: dict,
+    requests: int,
+    threads: int,
+    interop_threads: int,
+    references: dict
+) -> dict:
+    logging.basicConfig()
+    log = logging.getLogger("bench")
+    log.setLevel(logging.INFO)
+
+    before = resident_mb()
+    oracle = AiTextOracle(
+        log,
+        InferenceMode.INLINE,
+        max_batch_size=1,
+        cache=AnswerCache(),
+        model_folder=model_folder,
+        backend=backend,
+        threads=threads,
+        interop_threads=interop_threads
+    )
+    cold = dict(await oracle.warm_up())
+    loaded = resident_mb()
+
+    latencies = []
+    answers = {}
+    for method in PromptAnswerMethod:
+        if len(prompts[method]) == 0:
+            continue
+        for i in range(requests):
+            prompt = prompts[method][i % len(prompts[method])]
+            started = time.perf_counter()
+            answer = await oracle.answer_with(method, prompt)
+            latencies.append(time.perf_counter() - started)
+            answers.setdefault(prompt, []).append(answer)
+
+    # Quality: how this backend rates the answers of the baseline, which
+    # for the baseline itself are its own answers
+    references = references or answers
+    rankings = {}
+    likelihoods = []
+    for prompt, choices in references.items():
+        choices = list(dict.fromkeys([c for c in choices if len(c) > 0]))
+        if len(choices) == 0:
+            continue
+        scores = await oracle.rank_choices(prompt, choices, RANK_BUDGET)
+        if scores is None:
+            continue
+        rankings[prompt] = choices[scores.index(max(scores))]
+        likelihoods.extend(scores)
+    oracle.close()
+
+    given = [a for answered in answers.values() for a in answered]
+    return {
+        "backend": backend.name,
+        "cold": cold,
+        "memory_mb": {
+            "model": loaded - before,
+            "resident": loaded,
+            "peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        },
+        "latency": dict(
+            percentiles(latencies),
+            mean=sum(latencies) / len(latencies)
+        ),
+        "answers": answers,
+        "empty_answers": sum(1 for a in given if len(a) == 0) / len(given),
+        "reference_log_likelihood": (
+            sum(likelihoods) / len(likelihoods)
+            if likelihoods else
+            None
+        ),
+        "rankings": rankings
+    }
+
+
+def run_backend(*args) -> dict:
+    return asyncio.run(async_run_backend(*args))
+
+
+def bench_backends(
+    backends: list,
+    model_folder: str,
+    prompts: dict,
+    requests: int,
+    threads: int,
+    interop_threads: int
+) -> dict:
+    results = {
+        "machine": machine_info(),
+        "model": model_folder or "default",
+        "threads": threads,
+        "interop_threads": interop_threads,
+        "backends": []
+    }
+    # Every backend loads in a fresh process, so their memory is comparable
+    context = multiprocessing.get_context("spawn")
+    references = None
+    for backend in backends:
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            result = executor.submit(
+                run_backend,
+                backend,
+                model_folder,
+                prompts,
+                requests,
+                threads,
+                interop_threads,
+                references
+            ).result()
+        if references is None:
+            references = result["answers"]
+            baseline = result["rankings"]
+        result["ranking_agreement"] = sum(
+            1 for prompt in baseline
+            if result["rankings"].get(prompt) == baseline[prompt]
+        ) / max(len(baseline), 1)
+        results["backends"].append(result)
+    return results
+
+
+if __name__ == "__main__":
+    # python benchmarks/bench_backends.py [--model=checkpoint folder]
+    # [--backends=full,quantized] [--threads=4] [--interop=1]
+    # [--requests=16] [--prompts=prompts/quiplash2.txt] [--json=path]
+    options = dict([
+        (arg[2:].split("=", 1) + [None])[:2]
+        for arg in sys.argv[1:]
+        if arg.startswith("--")
+    ])
+    backends = [
+        ModelBackend[name.upper()]
+        for name in (options.get("backends") or "full,quantized").split(",")
+    ]
+    threads = int(options.get("threads") or os.cpu_count() or 1)
+    interop_threads = int(options.get("interop") or 1)
+    results_path = options.get("json") or RESULTS_PATH
+
+    results = bench_backends(
+        backends,
+        options.get("model"),
+        load_prompts(options.get("prompts") or PROMPT_PATH),
+        int(options.get("requests") or REQUESTS),
+        threads,
+        interop_threads
+    )
+
+    directory = os.path.dirname(results_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=4)
+
+    for result in results["backends"]:
+        print(
+            "%s: load %.2fs, %.0fMB, p50 %.0fms, p95 %.0fms, "
+            "%.0f%% empty, likelihood %.3f, %.0f%% rankings agree" % (
+                result["backend"],
+                sum(
+                    result["cold"].get(step, 0.0)
+                    for step in ("import", "load", "quantize")
+                ),
+                result["memory_mb"]["model"],
+                result["latency"]["p50"] * 1000,
+                result["latency"]["p95"] * 1000,
+                result["empty_answers"] * 100,
+                result["reference_log_likelihood"] or 0.0,
+                result["ranking_agreement"] * 100
+            )
+        )
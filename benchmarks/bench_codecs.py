@@ -0,0 +1,133 @@
+import glob
+import json
+import random
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from jackbot.api.wss.codec import (  # noqa: E402
+    LazyPacket,
+    available_codecs,
+    create_codec
+)
+
+
+RECV_PREFIX = "RECV - '"
+
+
+def load_wss_logs(paths: list) -> list:
+    # Frames as logged by V2WssApiHandler: RECV - '<frame>'
+    frames = []
+    for path in paths:
+        with open(path, "r") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith(RECV_PREFIX) and line.endswith("'"):
+                    frames.append(line[len(RECV_PREFIX):-1])
+    return frames
+
+
+def synthetic_frames(count: int = 2000) -> list:
+    # Shaped like Quiplash 2 traffic, for when no capture is at hand
+    rand = random.Random(1)
+    frames = []
+    for pc in range(count):
+        kind = rand.random()
+        if kind < 0.5:
+            result = {
+                "key": "bc:room",
+                "val": {
+                    "state": "Gameplay_Vote",
+                    "choices": [
+                        {"answer": "x" * rand.randint(5, 40)}
+                        for _ in range(2)
+                    ],
+                    "question": {
+                        "id": rand.randint(1, 9999),
+                        "prompt": "y" * rand.randint(30, 120)
+                    },
+                    "players": [
+                        {"name": "P%i" % i, "score": rand.randint(0, 5000)}
+                        for i in range(8)
+                    ]
+                },
+                "version": pc,
+                "from": 1
+            }
+            opcode = "object"
+        elif kind < 0.9:
+            result = {
+                "key": "bc:customer:%032x" % rand.getrandbits(128),
+                "val": {
+                    "state": "Gameplay_AnswerQuestion",
+                    "question": {
+                        "id": rand.randint(1, 9999),
+                        "prompt": "z" * rand.randint(30, 120)
+                    }
+                },
+                "version": pc,
+                "from": 1
+            }
+            opcode = "object"
+        else:
+            result = {}
+            opcode = "ok"
+        # Ecast sends compact JSON
+        frames.append(json.dumps({
+            "pc": pc,
+            "opcode": opcode,
+            "result": result
+        }, separators=(",", ":")))
+    return frames
+
+
+def timed(function, frames: list, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for frame in frames:
+            function(frame)
+    return time.perf_counter() - started
+
+
+def bench(frames: list, rounds: int) -> None:
+    total = len(frames) * rounds
+    size = sum(len(frame) for frame in frames) / len(frames)
+    print("%i frames, %.0f bytes on average, %i rounds" % (
+        len(frames), size, rounds
+    ))
+    print("%-10s %-12s %12s %12s" % ("codec", "path", "us/frame", "frames/s"))
+
+    messages = [create_codec("json").decode(frame) for frame in frames]
+    for name in available_codecs():
+        codec = create_codec(name)
+
+        def lazy_peek(frame):
+            packet = LazyPacket(frame, codec)
+            return (packet.opcode, packet.key)
+
+        paths = {
+            "decode": codec.decode,
+            "lazy-peek": lazy_peek,
+        }
+        for path, function in paths.items():
+            elapsed = timed(function, frames, rounds)
+            print("%-10s %-12s %12.2f %12.0f" % (
+                name, path, elapsed / total * 1e6, total / elapsed
+            ))
+
+        elapsed = timed(codec.encode, messages, rounds)
+        print("%-10s %-12s %12.2f %12.0f" % (
+            name, "encode", elapsed / total * 1e6, total / elapsed
+        ))
+
+if __name__ == "__main__":
+    # Usage: bench_codecs.py [rounds] [wss log glob]
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    paths = glob.glob(sys.argv[2]) if len(sys.argv) > 2 else []
+
+    frames = load_wss_logs(paths)
+    if len(frames) == 0:
+        print("No recorded frames found, using synthetic traffic")
+        frames = synthetic_frames()
+    bench(frames, rounds)
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, ".")
+
+from benchmarks.fake_ecast import (  # noqa: E402
+    QUESTIONS,
+    room_code,
+    run_fake_ecast
+)
+from jackbot.answering import seed_answers  # noqa: E402
+from jackbot.api.http.v2_impl import create_http_api  # noqa: E402
+from jackbot.fleet import BotEntry, BotStatus, JackboxFleet  # noqa: E402
+from jackbot.logging import set_packet_sample_rate  # noqa: E402
+from jackbot.strategy.quiplash2 import (  # noqa: E402
+    Quiplash2Strategy,
+    VoteMode
+)
+from main import setup_registry  # noqa: E402
+
+
+SAMPLE_INTERVAL = 0.5
+CANNED_ANSWERS = ["a soggy sock", "my landlord", "regret", "a tiny horse"]
+
+
+async def load_canned_answers() -> None:
+    # Without --oracle the bots answer from the oracle's cache and vote at
+    # random, so that only the message pipeline is measured, not the model
+    Quiplash2Strategy.VOTE_MODE = VoteMode.RANDOM
+    await seed_answers(QUESTIONS, CANNED_ANSWERS)
+
+
+def fleet_manifest(rooms: int, players: int) -> list:
+    return [
+        BotEntry(room_code(room), "Bot%i-%i" % (room, player))
+        for room in range(rooms)
+        for player in range(players)
+    ]
+
+
+async def fetch_stats(host: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get("http://%s/stats" % host) as response:
+            return await response.json()
+
+
+async def wait_for_server(host: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await fetch_stats(host)
+            return
+        except aiohttp.ClientError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def sample_concurrency(fleet: JackboxFleet, samples: list) -> None:
+    while not fleet.is_done():
+        samples.append(fleet.status_summary()[BotStatus.PLAYING])
+        await asyncio.sleep(SAMPLE_INTERVAL)
+
+
+async def async_bench_fleet(
+    rooms: int,
+    players: int,
+    host: str,
+    canned: bool
+) -> dict:
+    log = logging.getLogger("bench")
+    await wait_for_server(host)
+    if canned:
+        await load_canned_answers()
+
+    api = create_http_api(log, host)
+    fleet = JackboxFleet(fleet_manifest(rooms, players), api, log)
+
+    samples = []
+    sampler = asyncio.create_task(sample_concurrency(fleet, samples))
+    started = time.perf_counter()
+    try:
+        summary = await fleet.run()
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        await api.close()
+
+    server = await fetch_stats(host)
+    playing = [sample for sample in samples if sample > 0]
+    return {
+        "bots": rooms * players,
+        "rooms": rooms,
+        "elapsed": elapsed,
+        "finished": summary[BotStatus.FINISHED],
+        "failed": summary[BotStatus.FAILED],
+        "peak_concurrency": max(samples, default=0),
+        "mean_concurrency": sum(playing) / max(len(playing), 1),
+        "frames_received": fleet.packets_received(),
+        "frames_received_per_second": fleet.packets_received() / elapsed,
+        "server": server
+    }
+
+
+def print_results(results: dict) -> None:
+    server = results["server"]
+    print(
+        "%i bots in %i rooms: %i finished, %i failed in %.2fs"
+        % (
+            results["bots"],
+            results["rooms"],
+            results["finished"],
+            results["failed"],
+            results["elapsed"]
+        )
+    )
+    print(
+        "Concurrency: peak %i, mean %.0f playing"
+        % (results["peak_concurrency"], results["mean_concurrency"])
+    )
+    print(
+        "Throughput: %.0f frames/s received by bots, %.0f frames/s "
+        "through the server"
+        % (
+            results["frames_received_per_second"],
+            server["frames_per_second"]
+        )
+    )
+    for kind in ("answer", "vote"):
+        latency = server["%s_latency" % kind]
+        print(
+            "%s latency over %i: %s, %i timeouts" % (
+                kind.capitalize(),
+                server["%ss" % kind],
+                ", ".join([
+                    "%s %.1fms" % (point, seconds * 1000)
+                    for point, seconds in latency.items()
+                ]),
+                server["timeouts"]
+            )
+        )
+
+
+if __name__ == "__main__":
+    # python benchmarks/bench_fleet.py [rooms] [players per room] [rounds]
+    # [--port=38000] [--json=results.json] [--oracle]
+    options = dict([
+        (arg[2:].split("=", 1) + [None])[:2]
+        for arg in sys.argv[1:]
+        if arg.startswith("--")
+    ])
+    argv = [arg for arg in sys.argv if not arg.startswith("--")]
+    rooms = int(argv[1]) if len(argv) > 1 else 1000
+    players = int(argv[2]) if len(argv) > 2 else 1
+    rounds = int(argv[3]) if len(argv) > 3 else 3
+    port = int(options.get("port") or 38000)
+    host = "127.0.0.1:%i" % port
+
+    # Every bot holds a socket, and so does its end in the server
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    setup_registry()
+    set_packet_sample_rate(0.0)
+
+    server = multiprocessing.Process(
+        target=run_fake_ecast,
+        args=(rooms, players, rounds, "127.0.0.1", port),
+        daemon=True
+    )
+    server.start()
+    try:
+        results = asyncio.run(async_bench_fleet(
+            rooms,
+            players,
+            host,
+            "oracle" not in options
+        ))
+    finally:
+        server.terminate()
+        server.join()
+
+    print_results(results)
+    if options.get("json") is not None:
+        with open(options["json"], "w") as f:
+            json.dump(results, f, indent=4)
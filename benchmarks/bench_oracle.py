@@ -0,0 +1,222 @@
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+# The suite is meant for CPU-only boxes, keep torch off any GPU around
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+sys.path.insert(0, ".")
+
+from jackbot.answer_cache import AnswerCache  # noqa: E402
+from jackbot.generation import set_torch_threads  # noqa: E402
+from jackbot.metrics import percentiles  # noqa: E402
+from jackbot.orcale import (  # noqa: E402
+    AiTextOracle,
+    InferenceMode,
+    PromptAnswerMethod,
+    prompt_method
+)
+from jackbot.singleton import Singleton  # noqa: E402
+
+
+PROMPT_PATH = "prompts/quiplash2.txt"
+RESULTS_PATH = "results/bench_oracle.json"
+REQUESTS = 32
+
+SWEEP = {
+    "threads": [1, os.cpu_count() or 1],
+    "workers": [1],
+    "batch": [1, 4, 8],
+    "concurrency": [1, 4, 16]
+}
+
+
+def load_prompts(path: str) -> dict:
+    prompts = {method: [] for method in PromptAnswerMethod}
+    with open(path, "r") as f:
+        for line in f:
+            prompt = line.strip()
+            if len(prompt) > 0:
+                prompts[prompt_method(prompt)].append(prompt)
+    return prompts
+
+
+def machine_info() -> dict:
+    import torch
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__
+    }
+
+
+def create_oracle(
+    log: logging.Logger,
+    model_folder: str,
+    batch: int,
+    workers: int,
+    ai=None
+) -> AiTextOracle:
+    # Each configuration gets a fresh oracle, but they all share the one
+    # model already in memory. The cache is left empty so that every
+    # request reaches the model.
+    Singleton._instances.pop(AiTextOracle, None)
+    oracle = AiTextOracle(
+        log,
+        InferenceMode.THREAD,
+        workers,
+        batch,
+        cache=AnswerCache(),
+        model_folder=model_folder
+    )
+    oracle.ai = ai
+    return oracle
+
+
+async def measure(
+    oracle: AiTextOracle,
+    method: PromptAnswerMethod,
+    prompts: list,
+    requests: int,
+    concurrency: int
+) -> dict:
+    limiter = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def answer(prompt: str) -> None:
+        async with limiter:
+            started = time.perf_counter()
+            await oracle.answer_with(method, prompt)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        answer(prompts[i % len(prompts)])
+        for i in range(requests)
+    ])
+    elapsed = time.perf_counter() - started
+    return {
+        "method": method.name,
+        "requests": requests,
+        "elapsed": elapsed,
+        "prompts_per_second": requests / elapsed,
+        "latency": dict(
+            percentiles(latencies),
+            mean=sum(latencies) / len(latencies)
+        )
+    }
+
+
+async def async_bench_oracle(
+    model_folder: str,
+    prompts: dict,
+    sweep: dict,
+    requests: int
+) -> dict:
+    logging.basicConfig()
+    log = logging.getLogger("bench")
+    log.setLevel(logging.INFO)
+
+    # Cold load: import, load and the first generation of a fresh process
+    oracle = create_oracle(log, model_folder, 1, 1)
+    cold = dict(await oracle.warm_up())
+    ai = oracle.ai
+    oracle.close()
+
+    results = {
+        "machine": machine_info(),
+        "model": model_folder or "default",
+        "requests": requests,
+        "cold": cold,
+        "runs": []
+    }
+    methods = [method for method in PromptAnswerMethod if prompts[method]]
+    for threads in sweep["threads"]:
+        set_torch_threads(threads)
+        for workers in sweep["workers"]:
+            for batch in sweep["batch"]:
+                oracle = create_oracle(log, model_folder, batch, workers, ai)
+                # Not counted, the first call of a configuration is slower
+                await oracle.answer_with(methods[0], prompts[methods[0]][0])
+                for concurrency in sweep["concurrency"]:
+                    for method in methods:
+                        run = await measure(
+                            oracle,
+                            method,
+                            prompts[method],
+                            requests,
+                            concurrency
+                        )
+                        run.update(
+                            threads=threads,
+                            workers=workers,
+                            batch=batch,
+                            concurrency=concurrency
+                        )
+                        results["runs"].append(run)
+                        log.info(
+                            "threads %i, workers %i, batch %i, "
+                            "concurrency %i, %s: %.2f prompts/s, "
+                            "p50 %.0fms, p95 %.0fms, p99 %.0fms" % (
+                                threads,
+                                workers,
+                                batch,
+                                concurrency,
+                                method.name,
+                                run["prompts_per_second"],
+                                run["latency"]["p50"] * 1000,
+                                run["latency"]["p95"] * 1000,
+                                run["latency"]["p99"] * 1000
+                            )
+                        )
+                oracle.close()
+    return results
+
+
+if __name__ == "__main__":
+    # python benchmarks/bench_oracle.py [--model=checkpoint folder]
+    # [--prompts=prompts/quiplash2.txt] [--requests=32] [--json=path]
+    # [--threads=1,4] [--workers=1] [--batch=1,4,8] [--concurrency=1,4,16]
+    options = dict([
+        (arg[2:].split("=", 1) + [None])[:2]
+        for arg in sys.argv[1:]
+        if arg.startswith("--")
+    ])
+    sweep = {
+        name: (
+            [int(value) for value in options[name].split(",")]
+            if options.get(name) is not None else
+            values
+        )
+        for name, values in SWEEP.items()
+    }
+    results_path = options.get("json") or RESULTS_PATH
+
+    results = asyncio.run(async_bench_oracle(
+        options.get("model"),
+        load_prompts(options.get("prompts") or PROMPT_PATH),
+        sweep,
+        int(options.get("requests") or REQUESTS)
+    ))
+
+    directory = os.path.dirname(results_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=4)
+    print(
+        "Cold load: %s. Wrote %i runs to '%s'" % (
+            ", ".join([
+                "%s %.2fs" % (name, seconds)
+                for name, seconds in results["cold"].items()
+            ]),
+            len(results["runs"]),
+            results_path
+        )
+    )
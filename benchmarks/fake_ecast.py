@@ -0,0 +1,397 @@
+import asyncio
+import json
+import sys
+import time
+import uuid
+
+from aiohttp import WSMsgType, web
+
+sys.path.insert(0, ".")
+
+from jackbot.metrics import percentiles  # noqa: E402
+
+
+# Prompts asked by the stand-in, both kinds the oracle knows how to answer
+QUESTIONS = [
+    "The worst thing to find in your sandwich",
+    "A terrible name for a pet goldfish",
+    "The best part about being a ghost",
+    "What your GPS says when it gives up",
+    "A rejected flavor of potato chips: ____",
+    "The real reason the dinosaurs went extinct: ____",
+    "A bad thing to say at a job interview: ____",
+    "What aliens think of humans: ____",
+]
+
+HOST_ID = 1
+APP_ID = "c01f66be-745d-4173-8dac-c60395b2437a"
+APP_TAG = "quiplash2"
+
+
+def room_code(index: int) -> str:
+    # Four letters, like the real thing: AAAA, AAAB, ...
+    letters = []
+    for _ in range(4):
+        index, letter = divmod(index, 26)
+        letters.append(chr(ord("A") + letter))
+    return "".join(reversed(letters))
+
+
+class FakeEcastStats:
+    def __init__(self) -> None:
+        self.started: float = None
+        self.connections = 0
+        self.peak_connections = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.games_started = 0
+        self.games_finished = 0
+        self.timeouts = 0
+        self.answer_latency: list = []
+        self.vote_latency: list = []
+
+    def connected(self) -> None:
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.connections += 1
+        self.peak_connections = max(self.peak_connections, self.connections)
+
+    def to_json(self) -> dict:
+        elapsed = (
+            time.perf_counter() - self.started
+            if self.started is not None else
+            0.0
+        )
+        return {
+            "elapsed": elapsed,
+            "connections": self.connections,
+            "peak_connections": self.peak_connections,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "frames_per_second": (
+                (self.frames_in + self.frames_out) / elapsed
+                if elapsed > 0 else
+                0.0
+            ),
+            "games_started": self.games_started,
+            "games_finished": self.games_finished,
+            "timeouts": self.timeouts,
+            "answers": len(self.answer_latency),
+            "answer_latency": percentiles(self.answer_latency),
+            "votes": len(self.vote_latency),
+            "vote_latency": percentiles(self.vote_latency),
+        }
+
+
+class FakePlayer:
+    def __init__(self, player_id: int, name: str, user_id: str) -> None:
+        self.id = player_id
+        self.name = name
+        self.user_id = user_id
+        self.secret = uuid.uuid4().hex
+        self.device = uuid.uuid4().hex[:12]
+        self.socket: web.WebSocketResponse = None
+        self.waiting: dict = {}     # "answer"/"vote" -> future of the body
+
+    def customer_key(self) -> str:
+        return "bc:customer:%s" % self.user_id
+
+
+class FakeRoom:
+    def __init__(self, server, code: str) -> None:
+        self.server = server
+        self.code = code
+        self.players: dict = {}         # player id -> FakePlayer
+        self.entities: dict = {}        # key -> [val, version]
+        self.game: asyncio.Task = None
+        self.set_entity("bc:room", {"state": "Lobby"})
+
+    def set_entity(self, key: str, val: dict) -> dict:
+        version = self.entities[key][1] + 1 if key in self.entities else 0
+        self.entities[key] = [val, version]
+        return {"key": key, "val": val, "version": version, "from": HOST_ID}
+
+    def join(self, name: str, user_id: str, secret=None, player_id=None):
+        if secret is not None:
+            player = self.players.get(int(player_id or 0))
+            if player is not None and player.secret == secret:
+                return player, True
+        player = FakePlayer(len(self.players) + 2, name, user_id)
+        self.players[player.id] = player
+        return player, False
+
+    def welcome(self, player: FakePlayer, reconnect: bool) -> dict:
+        visible = ["bc:room", player.customer_key()]
+        return {
+            "id": player.id,
+            "name": player.name,
+            "secret": player.secret,
+            "reconnect": reconnect,
+            "deviceId": player.device,
+            "entities": {
+                key: ["object", {
+                    "key": key,
+                    "val": self.entities[key][0],
+                    "version": self.entities[key][1],
+                    "from": HOST_ID
+                }]
+                for key in visible
+                if key in self.entities
+            },
+            "here": {
+                str(p.id): {"id": p.id, "roles": {"player": {}}}
+                for p in self.players.values()
+            },
+            "profile": None
+        }
+
+    async def broadcast(self, opcode: str, result: dict) -> None:
+        await asyncio.gather(*[
+            self.server.send(player, opcode, result)
+            for player in self.players.values()
+        ])
+
+    async def update_room(self, val: dict) -> None:
+        await self.broadcast("object", self.set_entity("bc:room", val))
+
+    async def ask(self, player: FakePlayer, kind: str, val: dict, samples):
+        reply = asyncio.get_running_loop().create_future()
+        player.waiting[kind] = reply
+        sent_at = time.perf_counter()
+        await self.server.send(
+            player,
+            "object",
+            self.set_entity(player.customer_key(), val)
+        )
+        try:
+            body = await asyncio.wait_for(reply, self.server.action_timeout)
+            samples.append(time.perf_counter() - sent_at)
+            return body
+        except asyncio.TimeoutError:
+            self.server.stats.timeouts += 1
+            return None
+        finally:
+            player.waiting.pop(kind, None)
+
+    async def play(self) -> None:
+        stats = self.server.stats
+        stats.games_started += 1
+        question_id = 0
+        for round_number in range(self.server.rounds):
+            players = list(self.players.values())
+
+            await self.update_room({"state": "Gameplay_AnswerQuestion"})
+            questions = {}
+            for player in players:
+                question_id += 1
+                questions[player.id] = {
+                    "id": question_id,
+                    "prompt": QUESTIONS[
+                        (question_id + round_number) % len(QUESTIONS)
+                    ]
+                }
+            answers = await asyncio.gather(*[
+                self.ask(player, "answer", {
+                    "state": "Gameplay_AnswerQuestion",
+                    "question": questions[player.id],
+                    "timer": self.server.action_timeout
+                }, stats.answer_latency)
+                for player in players
+            ])
+
+            choices = [
+                {"answer": body["answer"]}
+                for body in answers
+                if body is not None
+            ] or [{"answer": "..."}, {"answer": "..."}]
+            await self.update_room({
+                "state": "Gameplay_Vote",
+                "choices": choices,
+                "question": questions[players[0].id]
+            })
+            await asyncio.gather(*[
+                self.ask(player, "vote", {
+                    "state": "Gameplay_Vote",
+                    "doneVoting": False
+                }, stats.vote_latency)
+                for player in players
+            ])
+
+        await self.broadcast(
+            "client/disconnected",
+            {"id": HOST_ID, "role": "host"}
+        )
+        stats.games_finished += 1
+        for player in list(self.players.values()):
+            if player.socket is not None:
+                await player.socket.close()
+        self.server.reset_room(self.code)
+
+
+class FakeEcastServer:
+    def __init__(
+        self,
+        rooms: int = 1000,
+        players_per_room: int = 1,
+        rounds: int = 3,
+        host: str = "127.0.0.1",
+        port: int = 38000,
+        action_timeout: float = 30.0
+    ) -> None:
+        self.rooms: dict = {}
+        self.room_count = rooms
+        self.players_per_room = players_per_room
+        self.rounds = rounds
+        self.host = host
+        self.port = port
+        self.action_timeout = action_timeout
+
+        self.stats = FakeEcastStats()
+        self.packet_counter = 0
+        self.runner: web.AppRunner = None
+
+        for index in range(rooms):
+            self.reset_room(room_code(index))
+
+        self.app = web.Application()
+        self.app.router.add_get("/api/v2/rooms/{code}", self.handle_room)
+        self.app.router.add_get("/api/v2/rooms/{code}/play", self.handle_play)
+        self.app.router.add_get("/stats", self.handle_stats)
+
+    def reset_room(self, code: str) -> None:
+        self.rooms[code] = FakeRoom(self, code)
+
+    def room_body(self, room: FakeRoom) -> dict:
+        return {
+            "appId": APP_ID,
+            "appTag": APP_TAG,
+            "audienceEnabled": False,
+            "audienceHost": "%s:%i" % (self.host, self.port),
+            "code": room.code,
+            "host": "%s:%i" % (self.host, self.port),
+            "locked": room.game is not None,
+            "full": len(room.players) >= self.players_per_room,
+            "moderationEnabled": False,
+            "passwordRequired": False,
+            "twitchLocked": False,
+            "locale": "en",
+            "keepalive": False
+        }
+
+    async def handle_room(self, request: web.Request) -> web.Response:
+        room = self.rooms.get(request.match_info["code"].upper())
+        if room is None:
+            return web.json_response(
+                {"ok": False, "error": "no such room"},
+                status=404
+            )
+        return web.json_response({"ok": True, "body": self.room_body(room)})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats.to_json())
+
+    async def send(self, player: FakePlayer, opcode: str, result, re=None):
+        if player.socket is None or player.socket.closed:
+            return
+        self.packet_counter += 1
+        frame = {"pc": self.packet_counter, "opcode": opcode, "result": result}
+        if re is not None:
+            frame["re"] = re
+        self.stats.frames_out += 1
+        try:
+            await player.socket.send_str(json.dumps(frame))
+        except ConnectionResetError:
+            pass
+
+    async def handle_play(self, request: web.Request):
+        room = self.rooms.get(request.match_info["code"].upper())
+        socket = web.WebSocketResponse(protocols=("ecast-v0",))
+        await socket.prepare(request)
+
+        query = request.query
+        if room is None:
+            await socket.send_str(json.dumps({
+                "pc": 0,
+                "opcode": "error",
+                "result": {"code": 2003, "msg": "no such room"}
+            }))
+            await socket.close()
+            return socket
+
+        player, reconnect = room.join(
+            query.get("name", "player"),
+            query.get("user-id", uuid.uuid4().hex),
+            query.get("secret"),
+            query.get("id")
+        )
+        player.socket = socket
+        self.stats.connected()
+        try:
+            await self.send(player, "client/welcome", room.welcome(
+                player,
+                reconnect
+            ))
+            full = len(room.players) >= self.players_per_room
+            if room.game is None and full:
+                room.game = asyncio.create_task(room.play())
+
+            async for message in socket:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                self.stats.frames_in += 1
+                await self.handle_message(player, json.loads(message.data))
+        finally:
+            self.stats.connections -= 1
+        return socket
+
+    async def handle_message(self, player: FakePlayer, message: dict):
+        seq = message.get("seq")
+        if message.get("opcode") == "client/send":
+            body = message["params"]["body"]
+            for kind in ("answer", "vote"):
+                reply = player.waiting.get(kind)
+                if kind in body and reply is not None and not reply.done():
+                    reply.set_result(body)
+        await self.send(player, "ok", {}, seq)
+
+    async def start(self) -> None:
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port, backlog=4096)
+        await site.start()
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+async def async_run_fake_ecast(*args) -> None:
+    server = FakeEcastServer(*args)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def run_fake_ecast(*args) -> None:
+    try:
+        asyncio.run(async_run_fake_ecast(*args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    # python benchmarks/fake_ecast.py [rooms] [players per room] [rounds]
+    # [port], then point main.py at it with --ecast=127.0.0.1:<port>
+    argv = sys.argv
+    rooms = int(argv[1]) if len(argv) > 1 else 1000
+    players = int(argv[2]) if len(argv) > 2 else 1
+    rounds = int(argv[3]) if len(argv) > 3 else 3
+    port = int(argv[4]) if len(argv) > 4 else 38000
+    print(
+        "Fake ecast serving rooms %s..%s on 127.0.0.1:%i"
+        % (room_code(0), room_code(rooms - 1), port)
+    )
+    run_fake_ecast(rooms, players, rounds, "127.0.0.1", port)
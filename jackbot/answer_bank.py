@@ -0,0 +1,103 @@
+import hashlib
+import mmap
+import random
+import struct
+
+from jackbot.answer_cache import cache_key
+from jackbot.prompt import prompt_method
+from jackbot.singleton import Singleton
+
+
+# Layout: header, index of (key hash, offset, length) sorted by hash, then
+# the answers of each key as newline separated UTF-8 text.
+MAGIC = b"JBAB"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+INDEX_ENTRY = struct.Struct("<QII")
+
+
+def hash_key(key: str) -> int:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def write_answer_bank(path: str, answers: dict) -> None:
+    # answers: cache key -> list of answers
+    entries = sorted(
+        (hash_key(key), "\n".join(values).encode("utf-8"))
+        for key, values in answers.items()
+        if len(values) > 0
+    )
+
+    data_start = HEADER.size + INDEX_ENTRY.size * len(entries)
+    index = bytearray()
+    data = bytearray()
+    for key_hash, blob in entries:
+        index += INDEX_ENTRY.pack(key_hash, data_start + len(data), len(blob))
+        data += blob
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        f.write(index)
+        f.write(data)
+
+
+class AnswerBank(metaclass=Singleton):
+    def __init__(self) -> None:
+        self.file = None
+        self.map: mmap.mmap = None
+        self.count = 0
+        self.hits = 0
+
+    def load_from(self, path: str) -> None:
+        self.close()
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("'%s' is not a version %i answer bank" % (
+                path, VERSION
+            ))
+        self.count = count
+
+    def is_loaded(self) -> bool:
+        return self.map is not None
+
+    def lookup(self, key: str) -> list:
+        if self.map is None:
+            return None
+
+        target = hash_key(key)
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            key_hash, offset, length = INDEX_ENTRY.unpack_from(
+                self.map, HEADER.size + middle * INDEX_ENTRY.size
+            )
+            if key_hash < target:
+                low = middle + 1
+            elif key_hash > target:
+                high = middle
+            else:
+                blob = self.map[offset:offset + length]
+                return blob.decode("utf-8").split("\n")
+        return None
+
+    def pick(self, prompt: str) -> str:
+        answers = self.lookup(cache_key(prompt_method(prompt), prompt))
+        if answers is None:
+            return None
+        self.hits += 1
+        return random.choice(answers)
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.count = 0
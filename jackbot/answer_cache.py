@@ -0,0 +1,191 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import random
+import sqlite3
+import time
+import regex
+
+from jackbot.prompt import BLANKS_PATTERN
+
+
+NON_WORD_PATTERN = regex.compile(r"[^\w]+")
+
+
+def normalize_prompt(text: str) -> str:
+    text = BLANKS_PATTERN.sub(" _ ", text.casefold())
+    return NON_WORD_PATTERN.sub(" ", text).strip()
+
+
+def cache_key(method: int, prompt: str) -> str:
+    return "%i:%s" % (method, normalize_prompt(prompt))
+
+
+class AnswerStore:
+    TIMEOUT = 30.0          # Seconds to wait on other processes writing
+    USED_BATCH = 256        # Lookups whose recency is written together
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        # Every worker process of a supervisor shares the file. In WAL mode
+        # readers never wait on the writer, and commits do not sync.
+        self.db = sqlite3.connect(
+            path,
+            timeout=self.TIMEOUT,
+            check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, answers TEXT NOT NULL, used REAL NOT NULL)"
+        )
+        self.db.commit()
+        # Only decides when to evict, other processes add rows too
+        self.entries = self.db.execute(
+            "SELECT COUNT(*) FROM answers"
+        ).fetchone()[0]
+        self.used: dict = {}    # key -> last lookup not written yet
+
+    def get(self, key: str) -> list:
+        row = self.db.execute(
+            "SELECT answers FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.used[key] = time.time()
+        if len(self.used) >= self.USED_BATCH:
+            self.flush_used()
+            self.db.commit()
+        return json.loads(row[0])
+
+    def flush_used(self) -> None:
+        if len(self.used) > 0:
+            self.db.executemany(
+                "UPDATE answers SET used = ? WHERE key = ?",
+                [(used, key) for key, used in self.used.items()]
+            )
+            self.used.clear()
+
+    def put(self, key: str, answers: list) -> None:
+        self.used.pop(key, None)
+        self.flush_used()
+        cursor = self.db.execute(
+            "UPDATE answers SET answers = ?, used = ? WHERE key = ?",
+            (json.dumps(answers), time.time(), key)
+        )
+        if cursor.rowcount == 0:
+            self.db.execute(
+                "INSERT INTO answers (key, answers, used) VALUES (?, ?, ?)",
+                (key, json.dumps(answers), time.time())
+            )
+            self.entries += 1
+        if self.entries > self.max_entries:
+            self.evict()
+        self.db.commit()
+
+    def evict(self) -> None:
+        # Drop the least recently used tenth in one go
+        self.entries = self.db.execute(
+            "SELECT COUNT(*) FROM answers"
+        ).fetchone()[0]
+        if self.entries <= self.max_entries:
+            return
+        excess = self.entries - self.max_entries + self.max_entries // 10
+        cursor = self.db.execute(
+            "DELETE FROM answers WHERE key IN ("
+            "SELECT key FROM answers ORDER BY used ASC LIMIT ?)",
+            (excess,)
+        )
+        self.entries -= cursor.rowcount
+
+    def close(self) -> None:
+        self.flush_used()
+        self.db.commit()
+        self.db.close()
+
+
+class AnswerCache:
+    MEMORY_ENTRIES = 4096
+    DISK_ENTRIES = 200000
+    VARIETY = 3     # Answers to collect for a prompt before reusing them
+
+    def __init__(
+        self,
+        path: str = None,
+        memory_entries: int = None,
+        disk_entries: int = None,
+        variety: int = None
+    ) -> None:
+        self.memory_entries = memory_entries or self.MEMORY_ENTRIES
+        self.variety = variety or self.VARIETY
+        self.memory: OrderedDict = OrderedDict()
+
+        # The store is only touched from its own thread, off the event loop
+        self.store: AnswerStore = None
+        self.executor: ThreadPoolExecutor = None
+        if path is not None:
+            self.store = AnswerStore(path, disk_entries or self.DISK_ENTRIES)
+            self.executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="answer-cache"
+            )
+
+        self.hits = 0
+        self.misses = 0
+
+    def __remember(self, key: str, answers: list) -> None:
+        self.memory[key] = answers
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def recall(self, key: str) -> list:
+        answers = self.memory.get(key)
+        if answers is not None:
+            self.memory.move_to_end(key)
+        return answers
+
+    async def run_in_store(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def get(self, key: str) -> list:
+        answers = self.recall(key)
+        if answers is None and self.store is not None:
+            answers = await self.run_in_store(self.store.get, key)
+            if answers is not None:
+                self.__remember(key, answers)
+        return answers
+
+    async def pick(self, key: str) -> str:
+        answers = await self.get(key)
+        if answers is None or len(answers) < self.variety:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return random.choice(answers)
+
+    async def add(self, key: str, answer: str) -> None:
+        answers = list(await self.get(key) or [])
+        if answer in answers:
+            return
+        answers.append(answer)
+        answers = answers[-self.variety:]
+
+        self.__remember(key, answers)
+        if self.store is not None:
+            await self.run_in_store(self.store.put, key, answers)
+
+    def close(self) -> None:
+        if self.store is not None:
+            # Queued behind any lookups and writes still running
+            self.executor.submit(self.store.close)
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            self.store = None
@@ -0,0 +1,90 @@
+import asyncio
+from enum import IntEnum
+import random
+import time
+
+from jackbot.answer_bank import AnswerBank
+from jackbot.answer_cache import AnswerCache, cache_key
+from jackbot.metrics import MetricsRegistry
+from jackbot.orcale import AiTextOracle
+from jackbot.prompt import prompt_method
+
+
+ANSWER_TIERS = MetricsRegistry().counter(
+    "jackbot_answer_tiers_total",
+    "Answers submitted, by the tier they came from",
+    ("tier",)
+)
+
+# Last resort when nothing better is ready in time
+TEMPLATE_ANSWERS = (
+    "My mom",
+    "A sad clown",
+    "Regret",
+    "Three raccoons in a trench coat",
+    "Your browser history",
+    "Nothing, and I mean nothing",
+    "A suspicious amount of glitter",
+    "The void",
+)
+
+
+class AnswerTier(IntEnum):
+    BANK = 0        # Precomputed, looked up before the model
+    ORACLE = 1      # Generated within the deadline
+    CACHE = 2       # Generated earlier, possibly for another bot
+    TEMPLATE = 3
+
+
+async def seed_answers(prompts: list, answers: list) -> None:
+    # For offline runs. Every prompt gets answered from the oracle's
+    # cache, so the model is never loaded.
+    cache = AiTextOracle(cache=AnswerCache()).cache
+    for prompt in prompts:
+        key = cache_key(prompt_method(prompt), prompt)
+        for answer in answers:
+            await cache.add(key, answer)
+
+
+def fallback_answer(prompt: str) -> tuple:
+    # Past the deadline, so only what is at hand without waiting
+    key = cache_key(prompt_method(prompt), prompt)
+    answers = AiTextOracle().cache.recall(key)
+    if answers:
+        return (random.choice(answers), AnswerTier.CACHE)
+
+    return (random.choice(TEMPLATE_ANSWERS), AnswerTier.TEMPLATE)
+
+
+def consume_result(task: asyncio.Future) -> None:
+    # Nobody waits on a generation that missed its deadline
+    if not task.cancelled():
+        task.exception()
+
+
+async def answer_before(prompt: str, deadline: float) -> tuple:
+    # Deadline as in time.perf_counter(). Returns (answer, tier).
+    # Precomputed answers spare us the model entirely
+    answer = AnswerBank().pick(prompt)
+    tier = AnswerTier.BANK
+    if answer is None:
+        generation = asyncio.ensure_future(
+            AiTextOracle().find_answer(prompt)
+        )
+        generation.add_done_callback(consume_result)
+        try:
+            # A generation that misses still lands in the cache for later
+            answer, cached = await asyncio.wait_for(
+                asyncio.shield(generation),
+                max(0.0, deadline - time.perf_counter())
+            )
+            tier = AnswerTier.CACHE if cached else AnswerTier.ORACLE
+        except Exception:
+            # Missed or failed, something else gets submitted either way
+            answer = ""
+
+        if len(answer) == 0:
+            answer, tier = fallback_answer(prompt)
+
+    ANSWER_TIERS.inc(1, (tier.name.lower(),))
+    return (answer, tier)
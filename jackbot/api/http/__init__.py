@@ -2,5 +2,11 @@ class HttpApiHandler:
     def __init__(self) -> None:
         pass
 
-    async def fetch(self, path) -> str:
+    def is_secure(self) -> bool:
+        return True
+
+    async def fetch(self, path) -> dict:
         raise NotImplementedError()
+
+    async def close(self) -> None:
+        pass
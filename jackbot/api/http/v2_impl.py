@@ -1,4 +1,5 @@
-import requests
+import asyncio
+import aiohttp
 
 from jackbot.api.http import HttpApiHandler
 
@@ -10,13 +11,37 @@ class V2HttpMode:
 
 class V2HttpApiHandler(HttpApiHandler):
     PREFERRED_MODE = V2HttpMode.SECURE
-    BASE_API_URL = "ecast.jackboxgames.com/api/v2"
+    API_HOST = "ecast.jackboxgames.com"
+    API_PATH = "/api/v2"
 
-    def __init__(self, log) -> None:
+    MAX_CONNECTIONS = 32
+    MAX_CONCURRENT_REQUESTS = 16
+    KEEPALIVE_TIMEOUT = 30
+    CONNECT_TIMEOUT = 5
+    REQUEST_TIMEOUT = 10
+
+    def __init__(
+        self,
+        log,
+        max_concurrent_requests: int = None,
+        request_timeout: float = None,
+        host: str = None,
+        mode: int = None
+    ) -> None:
         self.__url_cache = None
-        self.__mode = self.PREFERRED_MODE
+        self.__host = host or self.API_HOST
+        self.__mode = mode or self.PREFERRED_MODE
         self.log = log
 
+        self.__session: aiohttp.ClientSession = None
+        self.__limiter = asyncio.Semaphore(
+            max_concurrent_requests or self.MAX_CONCURRENT_REQUESTS
+        )
+        self.__timeout = aiohttp.ClientTimeout(
+            total=request_timeout or self.REQUEST_TIMEOUT,
+            connect=self.CONNECT_TIMEOUT
+        )
+
     def __base_url(self) -> str:
         if(self.__url_cache is None):
             protocol = (
@@ -24,15 +49,47 @@ class V2HttpApiHandler(HttpApiHandler):
                 if self.__mode is V2HttpMode.SECURE else
                 "http"
             )
-            base = self.BASE_API_URL
+            base = self.__host + self.API_PATH
             self.__url_cache = f"{protocol}://{base}"
         return self.__url_cache
 
-    def __get(self, path) -> str:
+    def is_secure(self) -> bool:
+        return self.__mode == V2HttpMode.SECURE
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        # Created lazily as the session has to live on the running loop
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.MAX_CONNECTIONS,
+                keepalive_timeout=self.KEEPALIVE_TIMEOUT
+            )
+            self.__session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.__timeout
+            )
+        return self.__session
+
+    async def __get(self, path) -> dict:
         target = f"{self.__base_url()}/{path}"
-        print(target)
-        response = requests.get(target)
-        return response
+        self.log.debug("GET - %s", target)
+        async with self.__limiter:
+            session = self.__get_session()
+            async with session.get(target) as response:
+                # Ecast answers with a JSON body on errors as well
+                return await response.json(content_type=None)
+
+    async def fetch(self, path) -> dict:
+        return await self.__get(path)
+
+    async def close(self) -> None:
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
 
-    async def fetch(self, path) -> str:
-        return self.__get(path)
+def create_http_api(log, local_host: str = None) -> V2HttpApiHandler:
+    # A local stand-in for ecast, such as benchmarks/fake_ecast.py, speaks
+    # plain http and ws
+    if local_host is None:
+        return V2HttpApiHandler(log)
+    return V2HttpApiHandler(log, host=local_host, mode=V2HttpMode.UNSECURE)
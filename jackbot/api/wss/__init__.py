@@ -1,12 +1,14 @@
 
 class WssApiHandler:
+    packets_received = 0
+
     def __init__(self) -> None:
         pass
 
     def is_connected(self) -> bool:
         raise NotImplementedError()
 
-    async def connect(self, join_as) -> bool:
+    async def connect(self, join_as, secret=None, player_id=None) -> tuple:
         raise NotImplementedError()
 
     async def send(self, path, args) -> None:
@@ -15,5 +17,8 @@ class WssApiHandler:
     async def recieve(self, timeout) -> tuple:
         raise NotImplementedError()
 
+    async def recieve_packet(self, timeout):
+        raise NotImplementedError()
+
     async def close(self) -> None:
         raise NotImplementedError()
@@ -0,0 +1,68 @@
+import gzip
+import json
+import struct
+import time
+
+
+# A gzip stream of: magic, length prefixed JSON metadata, then records of
+# (seconds since start, direction, frame length) followed by the frame.
+MAGIC = b"JBCAP1\n"
+METADATA = struct.Struct("<I")
+RECORD = struct.Struct("<dBI")
+
+INBOUND = 0
+OUTBOUND = 1
+
+
+class CaptureWriter:
+    def __init__(self, path: str, metadata: dict = None) -> None:
+        self.path = path
+        self.file = gzip.open(path, "wb", compresslevel=6)
+        self.started = time.monotonic()
+        self.frames = 0
+
+        header = json.dumps(metadata or {}).encode("utf-8")
+        self.file.write(MAGIC)
+        self.file.write(METADATA.pack(len(header)))
+        self.file.write(header)
+
+    def record(self, direction: int, frame) -> None:
+        if isinstance(frame, str):
+            frame = frame.encode("utf-8")
+        offset = time.monotonic() - self.started
+        self.file.write(RECORD.pack(offset, direction, len(frame)))
+        self.file.write(frame)
+        self.frames += 1
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class Capture:
+    def __init__(self, metadata: dict, records: list) -> None:
+        self.metadata = metadata
+        self.records = records  # (offset, direction, frame)
+
+    def inbound(self) -> list:
+        return [r for r in self.records if r[1] == INBOUND]
+
+    def outbound(self) -> list:
+        return [r for r in self.records if r[1] == OUTBOUND]
+
+
+def read_capture(path: str) -> Capture:
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("'%s' is not a Jackbot capture" % path)
+        (length,) = METADATA.unpack(f.read(METADATA.size))
+        metadata = json.loads(f.read(length).decode("utf-8"))
+
+        records = []
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                break
+            offset, direction, length = RECORD.unpack(head)
+            frame = f.read(length).decode("utf-8")
+            records.append((offset, direction, frame))
+    return Capture(metadata, records)
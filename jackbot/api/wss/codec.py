@@ -0,0 +1,161 @@
+import json
+import regex
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Ecast puts the opcode, and the key of objects, ahead of the payload
+OPCODE_PATTERN = regex.compile(r'"opcode"\s*:\s*"([^"\\]*)"')
+KEY_PATTERN = regex.compile(r'"key"\s*:\s*"([^"\\]*)"')
+
+
+def json_depth(text: str, end: int) -> int:
+    # How deep in objects and arrays text[end] is, or -1 inside a string
+    depth = 0
+    in_string = False
+    escaped = False
+    for char in text[:end]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+    return -1 if in_string else depth
+
+
+def peek_field(text: str, name: str, pattern, depth: int) -> str:
+    # The first field of that name, if it sits at the given depth. When a
+    # nested one comes first, None leaves it to a full decode.
+    # Compact JSON can be scanned with find, which beats any regex
+    marker = '"%s":"' % name
+    start = text.find(marker)
+    if start >= 0:
+        if json_depth(text, start) != depth:
+            return None
+        start += len(marker)
+        end = text.find('"', start)
+        if end >= 0 and text.find("\\", start, end) < 0:
+            return text[start:end]
+    match = pattern.search(text)
+    if match is None or json_depth(text, match.start()) != depth:
+        return None
+    return match.group(1)
+
+
+class WireCodec:
+    NAME = None
+    FORMAT = "json"
+
+    def encode(self, message: dict) -> str:
+        raise NotImplementedError()
+
+    def decode(self, packet) -> dict:
+        raise NotImplementedError()
+
+
+class JsonCodec(WireCodec):
+    NAME = "json"
+
+    def __init__(self) -> None:
+        self.json_decoder = json.decoder.JSONDecoder()
+        self.json_encoder = json.encoder.JSONEncoder()
+
+    def encode(self, message: dict) -> str:
+        return self.json_encoder.encode(message)
+
+    def decode(self, packet) -> dict:
+        if isinstance(packet, bytes):
+            packet = packet.decode("utf-8")
+        return self.json_decoder.decode(packet)
+
+
+class OrjsonCodec(WireCodec):
+    NAME = "orjson"
+
+    def encode(self, message: dict) -> str:
+        # Ecast expects text frames, websockets sends bytes as binary frames
+        return orjson.dumps(message).decode("utf-8")
+
+    def decode(self, packet) -> dict:
+        return orjson.loads(packet)
+
+
+CODECS = {
+    JsonCodec.NAME: JsonCodec,
+    OrjsonCodec.NAME: OrjsonCodec
+}
+
+
+def available_codecs() -> list:
+    return [
+        name
+        for name in CODECS
+        if name != OrjsonCodec.NAME or orjson is not None
+    ]
+
+
+def create_codec(name: str = None) -> WireCodec:
+    if name is None:
+        name = OrjsonCodec.NAME if orjson is not None else JsonCodec.NAME
+    if name not in available_codecs():
+        raise ValueError("Wire codec '%s' is not available" % name)
+    return CODECS[name]()
+
+
+class LazyPacket:
+    __slots__ = ("raw", "codec", "_opcode", "_key", "_data")
+
+    def __init__(self, raw, codec: WireCodec) -> None:
+        self.raw = raw
+        self.codec = codec
+        self._opcode = None
+        self._key = None
+        self._data = None
+
+    def __text(self) -> str:
+        raw = self.raw
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    @property
+    def opcode(self) -> str:
+        if self._opcode is None:
+            self._opcode = peek_field(
+                self.__text(),
+                "opcode",
+                OPCODE_PATTERN,
+                1
+            )
+            if self._opcode is None:
+                self._opcode = self.data["opcode"]
+        return self._opcode
+
+    @property
+    def key(self) -> str:
+        # Only "object" style results carry a key, right in the result
+        if self._key is None and self._data is None:
+            self._key = peek_field(self.__text(), "key", KEY_PATTERN, 2)
+        if self._key is None:
+            result = self.data["result"]
+            self._key = result.get("key") if type(result) is dict else None
+        return self._key
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = self.codec.decode(self.raw)
+        return self._data
+
+    @property
+    def result(self):
+        return self.data["result"]
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from websockets.exceptions import ConnectionClosedOK
+
+from jackbot.api.wss import WssApiHandler
+from jackbot.api.wss.capture import Capture
+from jackbot.api.wss.codec import LazyPacket, WireCodec, create_codec
+from jackbot.api.wss.error import WssError
+
+
+class ReplayWssApiHandler(WssApiHandler):
+    def __init__(
+        self,
+        log: logging.Logger,
+        capture: Capture,
+        realtime: bool = False,
+        codec: WireCodec = None
+    ) -> None:
+        self.log = log
+        self.codec = codec if codec is not None else create_codec()
+        self.realtime = realtime
+
+        self.frames = capture.inbound()
+        self.position = 0
+        self.started: float = None
+        self.connected = False
+
+        self.packets_received = 0
+        self.packet_counter = 0
+        self.sent: list = []
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def connect(self, join_as, secret=None, player_id=None) -> tuple:
+        self.started = time.monotonic()
+        self.connected = True
+        try:
+            # The first frame of a capture is the welcome
+            packet = await self.recieve_packet(None)
+            return (True, (packet.opcode, packet.result, packet.data))
+        except Exception as e:
+            self.log.error(e)
+            self.connected = False
+            return (False, None)
+
+    async def close(self) -> None:
+        self.connected = False
+
+    async def recieve_packet(self, timeout=None) -> LazyPacket:
+        while True:
+            if not self.connected or self.position >= len(self.frames):
+                self.connected = False
+                raise ConnectionClosedOK(None, None)
+
+            offset, _, frame = self.frames[self.position]
+            self.position += 1
+            if self.realtime:
+                delay = self.started + offset - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                # Still let other tasks run, as a real socket would
+                await asyncio.sleep(0)
+
+            self.packets_received += 1
+            packet = LazyPacket(frame, self.codec)
+            match packet.opcode:
+                case "ok":
+                    # Replies to the recorded sends, not to ours
+                    continue
+                case "error":
+                    raise WssError(packet.result)
+                case _:
+                    return packet
+
+    async def recieve(self, timeout=None) -> tuple:
+        packet = await self.recieve_packet(timeout)
+        return (packet.opcode, packet.result, packet.data)
+
+    async def send(self, message, expect_reply=True) -> None:
+        self.packet_counter += 1
+        message["seq"] = self.packet_counter
+        self.sent.append((time.monotonic() - self.started, message))
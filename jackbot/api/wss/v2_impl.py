@@ -1,10 +1,41 @@
 import asyncio
-import json
 import logging
+import time
 import websockets
+from websockets.exceptions import ConnectionClosedOK
 
 from jackbot.api.wss import WssApiHandler
+from jackbot.api.wss.capture import INBOUND, OUTBOUND, CaptureWriter
+from jackbot.api.wss.codec import LazyPacket, WireCodec, create_codec
 from jackbot.api.wss.error import WssError
+from jackbot.metrics import MetricsRegistry
+
+
+# Marks packet dumps, which the logging pipeline may sample
+PACKET_RECORD = {"packet": True}
+
+PACKETS = MetricsRegistry().counter(
+    "jackbot_wss_packets_total",
+    "Websocket frames by direction",
+    ("direction",)
+)
+PACKET_BYTES = MetricsRegistry().counter(
+    "jackbot_wss_bytes_total",
+    "Websocket frame bytes by direction",
+    ("direction",)
+)
+SEND_RTT = MetricsRegistry().histogram(
+    "jackbot_wss_send_rtt_seconds",
+    "Time from the first send of a message to its reply"
+)
+SEND_RETRIES = MetricsRegistry().counter(
+    "jackbot_wss_send_retries_total",
+    "Messages sent again after their reply timed out"
+)
+SEND_FAILURES = MetricsRegistry().counter(
+    "jackbot_wss_send_failures_total",
+    "Messages that failed to send or never got a reply"
+)
 
 
 def mapping_to_uri(d: dict) -> str:
@@ -15,104 +46,219 @@ def mapping_to_uri(d: dict) -> str:
 
 
 class V2WssApiHandler(WssApiHandler):
-    BASE_API_URI = "wss://{0}/api/v2/rooms/{1}/play"
+    BASE_API_URI = "{0}://{1}/api/v2/rooms/{2}/play"
 
     CONNECT_TIMEOUT = 10
+    REPLY_TIMEOUT = 10
     MAX_SEND_TRIES = 3
+    REPLY_OPCODES = ("ok", "error")
 
-    def __init__(self, log: logging.Logger, host, code, uuid) -> None:
+    def __init__(
+        self,
+        log: logging.Logger,
+        host,
+        code,
+        uuid,
+        codec: WireCodec = None,
+        secure: bool = True
+    ) -> None:
         self.log = log
         self.host = host
         self.code = code
-        self.full_uri = self.BASE_API_URI.format(host, code)
+        self.full_uri = self.BASE_API_URI.format(
+            "wss" if secure else "ws",
+            host,
+            code
+        )
 
         self.uuid = uuid
         self.packet_counter = 0
+        self.packets_received = 0
 
-        self.json_decoder = json.decoder.JSONDecoder()
-        self.json_encoder = json.encoder.JSONEncoder()
+        self.codec = codec if codec is not None else create_codec()
         self.socket: websockets.client.WebSocketClientProtocol = None
 
+        self.reader: asyncio.Task = None
+        self.inbox: asyncio.Queue = None
+        self.pending_replies: dict = {}     # seq -> future of the reply
+
+        self.capture: CaptureWriter = None
+
+    def start_capture(self, path: str, metadata: dict = None) -> None:
+        # Records every frame, across reconnects, until stopped
+        self.stop_capture()
+        self.capture = CaptureWriter(path, dict(
+            metadata or {},
+            code=self.code,
+            uuid=self.uuid
+        ))
+
+    def stop_capture(self) -> None:
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+
     def is_connected(self) -> bool:
         return (
             self.socket is not None
             and not self.socket.closed
         )
 
-    async def connect(self, join_as: str) -> tuple:
+    async def connect(
+        self,
+        join_as: str,
+        secret: str = None,
+        player_id: int = None
+    ) -> tuple:
         try:
             args = {
                 "role": "player",
                 "name": join_as,
-                "format": "json",
+                "format": self.codec.FORMAT,
                 "user-id": self.uuid
             }
+            if secret is not None:
+                # Resumes the seat of an earlier connection
+                args["secret"] = secret
+                args["id"] = player_id
+            await self.close()
             self.socket = await websockets.connect(
                 self.full_uri + mapping_to_uri(args),
                 subprotocols=["ecast-v0"],
             )
-            welcome = await self.recieve(self.CONNECT_TIMEOUT)
-            return (True, welcome)
+            packet = await self.read_packet(self.CONNECT_TIMEOUT)
+            welcome = self.check_packet(packet)
+
+            # From here on a single reader owns the socket
+            self.inbox = asyncio.Queue()
+            self.reader = asyncio.create_task(self.read_loop())
+            return (True, (welcome.opcode, welcome.result, welcome.data))
         except Exception as e:
             self.log.error(e)
             await self.close()
             return (False, None)
 
     async def close(self) -> None:
-        await self.socket.close()
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+            # Wake up anyone still waiting on the inbox
+            self.inbox.put_nowait(ConnectionClosedOK(None, None))
+        if self.socket is not None:
+            await self.socket.close()
 
-    async def recieve(self, timeout=None) -> tuple:
+    async def read_packet(self, timeout=None) -> LazyPacket:
         response = await asyncio.wait_for(
             self.socket.recv(),
             timeout
         )
-        self.log.info("RECV - '%s'" % response)
+        self.packets_received += 1
+        if self.capture is not None:
+            self.capture.record(INBOUND, response)
+        PACKETS.inc(1, ("in",))
+        PACKET_BYTES.inc(len(response), ("in",))
+        self.log.info("RECV - '%s'", response, extra=PACKET_RECORD)
+        return LazyPacket(response, self.codec)
 
-        try:
-            parsed = self.__parse_response(response)
-            return parsed
-        except WssError as e:
+    def check_packet(self, packet: LazyPacket) -> LazyPacket:
+        if packet.opcode == "error":
+            e = WssError(packet.result)
             self.log.error(e)
             raise e
+        return packet
 
-    def __parse_response(self, packet) -> tuple:
-        data: dict = self.json_decoder.decode(packet)
+    def resolve_reply(self, packet: LazyPacket) -> bool:
+        # Replies carry the seq of the message they answer in "re"
+        if packet.opcode not in self.REPLY_OPCODES:
+            return False
+        reply = self.pending_replies.pop(packet.data.get("re"), None)
+        if reply is None:
+            return False
+        if not reply.done():
+            if packet.opcode == "error":
+                reply.set_exception(WssError(packet.result))
+            else:
+                reply.set_result(packet)
+        return True
 
-        opcode = data["opcode"]
-        result = data["result"]
-        match opcode:
-            case "error":
-                raise WssError(result)
-            case _:
-                return (opcode, result, data)
+    async def read_loop(self) -> None:
+        try:
+            while True:
+                packet = await self.read_packet()
+                if not self.resolve_reply(packet):
+                    self.inbox.put_nowait(packet)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Hand the failure, even a clean close, to whoever reads next
+            self.inbox.put_nowait(e)
+            for reply in self.pending_replies.values():
+                if not reply.done():
+                    reply.set_exception(e)
+            self.pending_replies.clear()
+
+    async def recieve_packet(self, timeout=None) -> LazyPacket:
+        packet = await asyncio.wait_for(self.inbox.get(), timeout)
+        if isinstance(packet, Exception):
+            # Keep failing for any later reader as well
+            self.inbox.put_nowait(packet)
+            raise packet
+        return self.check_packet(packet)
+
+    async def recieve(self, timeout=None) -> tuple:
+        packet = await self.recieve_packet(timeout)
+        return (packet.opcode, packet.result, packet.data)
 
     async def send(self, message, expect_reply=True) -> None:
-        # Prepare the message for sending
+        # Prepare the message for sending. Raises if it cannot be sent, and
+        # asyncio.TimeoutError if it gets no reply, which the game context
+        # logs and plays on from.
         self.packet_counter += 1
         this_packet_counter = self.packet_counter
         message["seq"] = this_packet_counter
 
-        to_send = self.json_encoder.encode(message)
+        to_send = self.codec.encode(message)
 
-        # Actually dispatch the message to server
-        send_attempt = 0
-        successful = False
-        while send_attempt < self.MAX_SEND_TRIES and not successful:
-            send_attempt += 1
-            self.log.debug("SEND - (Try %i): %s" % (send_attempt, to_send))
-            try:
-                await self.socket.send(to_send)
+        reply: asyncio.Future = None
+        if expect_reply:
+            reply = asyncio.get_running_loop().create_future()
+            self.pending_replies[this_packet_counter] = reply
 
-                if expect_reply:
-                    opcode, _, reply = await self.recieve(100)
-                    if reply["re"] == this_packet_counter and opcode == "ok":
-                        successful = True
-                    else:
-                        successful = False
-                else:
-                    successful = True
-            except TimeoutError:
-                pass
-            except Exception as e:
-                self.log.error("SEND - ERROR!: %s", e)
-                raise e
+        # Actually dispatch the message to server, other sends may be in
+        # flight meanwhile as the reader routes each reply by its seq
+        sent_at = time.perf_counter()
+        try:
+            for send_attempt in range(1, self.MAX_SEND_TRIES + 1):
+                self.log.debug(
+                    "SEND - (Try %i): %s", send_attempt, to_send,
+                    extra=PACKET_RECORD
+                )
+                if send_attempt > 1:
+                    SEND_RETRIES.inc()
+                await self.socket.send(to_send)
+                if self.capture is not None:
+                    self.capture.record(OUTBOUND, to_send)
+                PACKETS.inc(1, ("out",))
+                PACKET_BYTES.inc(len(to_send), ("out",))
+                if reply is None:
+                    return
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(reply),
+                        self.REPLY_TIMEOUT
+                    )
+                    SEND_RTT.observe(time.perf_counter() - sent_at)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+            # The message is lost, which the caller has to know about
+            raise asyncio.TimeoutError(
+                "No reply to %i after %i tries"
+                % (this_packet_counter, self.MAX_SEND_TRIES)
+            )
+        except Exception as e:
+            SEND_FAILURES.inc()
+            self.log.error("SEND - ERROR!: %s", e)
+            raise e
+        finally:
+            self.pending_replies.pop(this_packet_counter, None)
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+from jackbot.metrics import MetricsRegistry
+
+
+QUEUE_WAIT = MetricsRegistry().histogram(
+    "jackbot_oracle_queue_wait_seconds",
+    "Time prompts wait before generating, by what they wait on",
+    ("stage",)
+)
+BATCH_SIZE = MetricsRegistry().histogram(
+    "jackbot_oracle_batch_size",
+    "Prompts per batched generation",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+
+class GenerationRequest:
+    def __init__(self, prompt: str, future: asyncio.Future) -> None:
+        self.prompt = prompt
+        self.future = future
+        self.submitted_at = time.perf_counter()
+
+
+class GenerationBatcher:
+    BATCH_WINDOW = 0.025
+    MAX_BATCH_SIZE = 8
+
+    def __init__(
+        self,
+        run_batch,
+        window: float = None,
+        max_batch_size: int = None
+    ) -> None:
+        # run_batch(prompts, min_new, max_new, prefix) -> generated texts
+        self.run_batch = run_batch
+        self.window = window or self.BATCH_WINDOW
+        self.max_batch_size = max_batch_size or self.MAX_BATCH_SIZE
+
+        # Requests can only share a batch if they share token budgets and
+        # the prefix their prompts continue
+        self.pending: dict = {}     # (min_new, max_new, prefix) -> requests
+        self.timers: dict = {}      # (min_new, max_new, prefix) -> timer
+        self.running: set = set()
+        self.batches_run = 0
+
+    async def submit(
+        self,
+        prompt: str,
+        min_new: int,
+        max_new: int,
+        prefix: str = ""
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        budget = (min_new, max_new, prefix)
+        request = GenerationRequest(prompt, loop.create_future())
+
+        queue = self.pending.setdefault(budget, [])
+        queue.append(request)
+        if len(queue) >= self.max_batch_size:
+            self.flush(budget)
+        elif budget not in self.timers:
+            self.timers[budget] = loop.call_later(
+                self.window, self.flush, budget
+            )
+        return await request.future
+
+    def flush(self, budget: tuple) -> None:
+        timer = self.timers.pop(budget, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self.pending.pop(budget, [])
+        # Callers might have given up while waiting for the window
+        batch = [request for request in batch if not request.future.done()]
+        if len(batch) > 0:
+            task = asyncio.ensure_future(self.__run(batch, *budget))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def __run(
+        self,
+        batch: list,
+        min_new: int,
+        max_new: int,
+        prefix: str
+    ) -> None:
+        self.batches_run += 1
+        started = time.perf_counter()
+        for request in batch:
+            QUEUE_WAIT.observe(started - request.submitted_at, ("batch",))
+        BATCH_SIZE.observe(len(batch))
+        try:
+            outputs = await self.run_batch(
+                [request.prompt for request in batch],
+                min_new,
+                max_new,
+                prefix
+            )
+            for request, output in zip(batch, outputs):
+                if not request.future.done():
+                    request.future.set_result(output)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
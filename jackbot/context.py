@@ -1,11 +1,26 @@
 import asyncio
 import logging
-import websockets
+import random
+import time
+from websockets.exceptions import ConnectionClosed, ConnectionClosedOK
 
 from jackbot.api.wss import WssApiHandler
 from jackbot.join_enums import JoinReason
+from jackbot.metrics import MetricsRegistry
 from jackbot.player_info import PlayerInfo
 from jackbot.room import RoomInfo
+from jackbot.router import Message, MessageRouter, ObjectMessage
+
+
+ACTIVE_BOTS = MetricsRegistry().gauge(
+    "jackbot_bots_active",
+    "Bots currently playing a game"
+)
+ACT_LATENCY = MetricsRegistry().histogram(
+    "jackbot_act_latency_seconds",
+    "Time from receiving an update to acting on it, by game state",
+    ("state",)
+)
 
 
 class JackboxGameContext:
@@ -20,9 +35,26 @@ class GameStrategy:
     async def can_join(self, room_info: RoomInfo) -> JoinReason:
         return JoinReason.GAME_NOT_SUPPORTED
 
+    def register_routes(self, router: MessageRouter) -> None:
+        # Strategies can subscribe to more opcodes and object keys
+        router.on_object("bc:room", self.on_room_message)
+        router.on_object(self.context.costumer_key, self.on_customer_message)
+
+    async def on_room_message(self, message: ObjectMessage) -> None:
+        await self.on_room_update(message.val)
+
+    async def on_customer_message(self, message: ObjectMessage) -> None:
+        value = message.val
+        if type(value) is dict and "state" in value:
+            self.context.game_state = value["state"]
+        await self.on_game_update(value)
+
     async def on_join(self, body) -> None:
         pass
 
+    async def on_resume(self, body) -> None:
+        pass
+
     async def on_room_update(self, value) -> None:
         pass
 
@@ -37,6 +69,10 @@ class GameStrategy:
 
 
 class JackboxGameContext:
+    RECONNECT_TRIES = 6
+    RECONNECT_BASE_DELAY = 0.1
+    RECONNECT_MAX_DELAY = 2.0
+
     def __init__(
         self,
         player: PlayerInfo,
@@ -48,6 +84,7 @@ class JackboxGameContext:
 
         self.is_finished = False
         self.loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+        self.finished: asyncio.Future = self.loop.create_future()
 
         self.player_info = player
         self.costumer_key = "bc:customer:%s" % player.uuid
@@ -55,62 +92,120 @@ class JackboxGameContext:
         self.game_handler: GameStrategy = None
         self.receive_handler = None
 
+        # For measuring how long the bot takes to act on what it was sent
+        self.game_state: str = None
+        self.received_at: float = None
+
+        self.router = MessageRouter()
+        self.router.on_opcode("client/disconnected", self.on_disconnected)
+        self.router.on_unknown(self.on_unknown_opcode, self.on_unknown_object)
+
     def set_strategy(self, strategy_type):
         self.game_handler = strategy_type(self)
+        self.game_handler.register_routes(self.router)
 
-    async def join(self, join_as) -> bool:
-        result, (_, welcome, _) = await self.api.connect(join_as)
-        self.log.debug("Result on join: '%s', welcome: %s" % (result, welcome))
-
-        # Set player details
+    def set_player_details(self, welcome: dict) -> None:
         self.player_info.id = welcome["id"]
         self.player_info.secret = welcome["secret"]
         self.player_info.device = welcome["deviceId"]
 
-        if result:
-            await self.game_handler.on_join(welcome)
+    async def replay_entities(self, welcome: dict) -> None:
+        # The welcome carries the current state of every entity we can see,
+        # including those of other players that we have no use for
+        entities: dict = welcome.get("entities") or {}
+        for key, entity in entities.items():
+            if type(entity) is list and len(entity) > 1:
+                if entity[0] != "object":
+                    continue
+                if self.router.routes_object(entity[1].get("key")):
+                    await self.handle_object(entity[1])
+                else:
+                    self.log.debug("Skipped welcome entity '%s'" % key)
+
+    async def join(self, join_as) -> bool:
+        result, reply = await self.api.connect(join_as)
+        if not result:
+            self.log.debug("Result on join: '%s'" % result)
+            return result
+
+        _, welcome, _ = reply
+        self.log.debug("Result on join: '%s', welcome: %s", result, welcome)
+
+        # Set player details
+        self.set_player_details(welcome)
+
+        await self.game_handler.on_join(welcome)
+        await self.replay_entities(welcome)
         return result
 
+    async def reconnect(self) -> bool:
+        # Resume our seat using the secret from the first welcome
+        for attempt in range(self.RECONNECT_TRIES):
+            delay = min(
+                self.RECONNECT_MAX_DELAY,
+                self.RECONNECT_BASE_DELAY * 2 ** attempt
+            )
+            await asyncio.sleep(random.uniform(0, delay))
+
+            self.log.info("Reconnecting, attempt %i" % (attempt + 1))
+            result, reply = await self.api.connect(
+                self.player_info.name,
+                self.player_info.secret,
+                self.player_info.id
+            )
+            if result:
+                _, welcome, _ = reply
+                self.set_player_details(welcome)
+                await self.game_handler.on_resume(welcome)
+                await self.replay_entities(welcome)
+                self.log.info("Reconnected as player %i" % self.player_info.id)
+                return True
+        self.log.error(
+            "Could not reconnect after %i attempts" % self.RECONNECT_TRIES
+        )
+        return False
+
     async def listen_api(self) -> None:
         self.log.info("Started listening to Jackbox Services API")
-        should_be_listening = True
-        while self.api.is_connected() and should_be_listening:
-            try:
-                operation, data, f = await self.api.recieve(None)
-                self.log.debug("Recieved %s ::: %s" % (operation, data))
-                await self.on_recieve(operation, data, f)
-            except websockets.exceptions.ConnectionClosedOK:
-                should_be_listening = False
+        try:
+            while not self.is_finished:
+                try:
+                    packet = await self.api.recieve_packet(None)
+                except ConnectionClosedOK:
+                    break
+                except ConnectionClosed as e:
+                    self.log.warning("Connection dropped: %s" % e)
+                    if self.is_finished or not await self.reconnect():
+                        raise e
+                    continue
+                self.received_at = time.perf_counter()
+                await self.router.dispatch(packet)
+            self.finish()
+        except Exception as e:
+            self.log.error("Stopped listening due to error: %s" % e)
+            self.finish(e)
         self.log.info("Stopped listening to Jackbox Services API")
 
-    async def on_recieve(self, operation: str, data: str, full: dict) -> None:
-        match operation:
-            case "client/disconnected":
-                await self.api.close()
-                await self.game_handler.on_finished(data)
-                self.is_finished = True
-            case "object":
-                await self.handle_object(data)
-            case _:
-                self.log.error(
-                    "Unknown opcode received: %s. - Packet: %s"
-                    % (operation, full)
-                )
-
-    async def handle_object(self, data: str) -> None:
-        key = data["key"]
-        val = data["val"]
-
-        match key:
-            case "bc:room":
-                await self.game_handler.on_room_update(val)
-            case self.costumer_key:
-                await self.game_handler.on_game_update(val)
-            case _:
-                self.log.error(
-                    "Unknown object key received: %s. - Packet: %s"
-                    % (key, data)
-                )
+    async def on_disconnected(self, message: Message) -> None:
+        await self.api.close()
+        await self.game_handler.on_finished(message.result)
+        self.finish()
+
+    async def on_unknown_opcode(self, message: Message) -> None:
+        self.log.error(
+            "Unknown opcode received: %s. - Packet: %s"
+            % (message.opcode, message.data)
+        )
+
+    async def on_unknown_object(self, message: ObjectMessage) -> None:
+        self.log.error(
+            "Unknown object key received: %s. - Packet: %s"
+            % (message.key, message.result)
+        )
+
+    async def handle_object(self, data: dict) -> None:
+        message = ObjectMessage(data["key"], result=data)
+        await self.router.dispatch_object(message)
 
     async def send(self, message: dict, to_whom: int = 1) -> None:
         data: dict = {
@@ -122,14 +217,57 @@ class JackboxGameContext:
             }
         }
 
-        await self.api.send(data)
+        if self.received_at is not None:
+            ACT_LATENCY.observe(
+                time.perf_counter() - self.received_at,
+                (self.game_state or "unknown",)
+            )
+        try:
+            await self.deliver(data)
+        except asyncio.TimeoutError as e:
+            # Counted as a send failure already. The action may well have
+            # arrived, and one lost reply must not cost the bot its game.
+            self.log.error("No reply to action, playing on: %s" % e)
+
+    async def deliver(self, data: dict) -> None:
+        try:
+            await self.api.send(data)
+        except ConnectionClosedOK:
+            raise
+        except ConnectionClosed as e:
+            # Dropped while acting, which is when the seat matters most
+            self.log.warning("Connection dropped while sending: %s" % e)
+            if self.is_finished or not await self.reconnect():
+                raise e
+            await self.api.send(data)
 
     def should_quit(self) -> bool:
         return (not self.api.is_connected()) or self.is_finished
 
+    def finish(self, error: Exception = None) -> None:
+        self.is_finished = True
+        if not self.finished.done():
+            if error is None:
+                self.finished.set_result(None)
+            else:
+                self.finished.set_exception(error)
+
+    def on_listener_done(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self.finish(task.exception())
+        elif not self.is_finished:
+            self.finish()
+
     async def play_until_finished(self) -> None:
         self.receive_handler = self.loop.create_task(self.listen_api())
-
-        while not self.should_quit():
-            await asyncio.sleep(1)
-        return
+        self.receive_handler.add_done_callback(self.on_listener_done)
+        ACTIVE_BOTS.inc()
+        try:
+            # Raises whatever made the game end early
+            await self.finished
+        finally:
+            ACTIVE_BOTS.dec()
+            if not self.receive_handler.done():
+                self.receive_handler.cancel()
+            if self.api.is_connected():
+                await self.api.close()
@@ -0,0 +1,284 @@
+import asyncio
+from enum import IntEnum
+import json
+import logging
+from math import prod
+import os
+import random
+import uuid
+
+from jackbot.api.http import HttpApiHandler
+from jackbot.api.wss import WssApiHandler
+from jackbot.context import JackboxGameContext
+from jackbot.logging import (
+    create_game_logger,
+    create_wss_api_logger,
+    release_logger
+)
+from jackbot.orcale import AiTextOracle
+from jackbot.player_info import PlayerInfo
+from jackbot.room import RoomProbeCache
+from jackbot.strategy import JackboxGameRegistry
+
+
+class BotStatus(IntEnum):
+    PENDING = 0
+    PROBING = 1
+    JOINING = 2
+    PLAYING = 3
+    FINISHED = 4
+    FAILED = 5
+
+
+class BotEntry:
+    def __init__(self, code: str, name: str) -> None:
+        self.code = code
+        self.name = name
+        self.status = BotStatus.PENDING
+        self.error = None
+        self.context: JackboxGameContext = None
+
+    def __str__(self) -> str:
+        return "%s@%s (%s)" % (self.name, self.code, self.status.name)
+
+    def release(self) -> None:
+        # Closes the log and capture files of a bot that is done
+        if self.context is not None:
+            release_logger(self.context.log)
+            release_logger(self.context.api.log)
+            if hasattr(self.context.api, "stop_capture"):
+                self.context.api.stop_capture()
+
+
+def load_manifest(json_file_path: str) -> list:
+    with open(json_file_path, 'r') as f:
+        raw = json.load(f)
+        return [
+            BotEntry(bot["code"].upper(), bot["name"])
+            for bot in raw["bots"]
+        ]
+
+
+def generate_player_uuid(join_as: str, uuid_node: int = None) -> str:
+    name_seq = [ord(c) for c in join_as]
+    name_seed = (prod(name_seq) - sum(name_seq)) * sum(name_seq)
+
+    if uuid_node is None:
+        uuid_node = uuid.getnode()
+
+    rand = random.Random()
+    rand.seed(name_seed + uuid_node)
+
+    uuid_seq = rand.getrandbits(128)
+    uuid_gen = uuid.UUID(int=uuid_seq)
+    return uuid_gen.__str__()
+
+
+async def join_bot(
+    entry: BotEntry,
+    rooms: RoomProbeCache,
+    log: logging.Logger,
+    uuid_node: int = None,
+    capture_path: str = None
+) -> JackboxGameContext:
+    join_code = entry.code
+    join_as = entry.name
+
+    # Probe for room first
+    entry.status = BotStatus.PROBING
+    probe, room = await rooms.find_room(join_code)
+    log.debug(probe)
+    log.debug(room)
+    if not probe.ok:
+        log.info(
+            "Probe for room '%s' failed: %s" %
+            (join_code, probe.error)
+        )
+        entry.error = probe.error
+        entry.status = BotStatus.FAILED
+        return None
+
+    # Setup
+    # Select client
+    app_tag = room.app_tag
+    game_info = JackboxGameRegistry().get_game_by_tag(app_tag)
+    if game_info is None:
+        log.error("Unknown game! Known by tag '%s'" % app_tag)
+        entry.error = "Unknown game '%s'" % app_tag
+        entry.status = BotStatus.FAILED
+        return None
+
+    strategy_type = game_info.strategy_type
+    handler_type = game_info.handler_type
+
+    this_uuid = generate_player_uuid(join_as, uuid_node)
+    log.info("Assigned UUID: %s to '%s'" % (this_uuid, join_as))
+
+    player_info = PlayerInfo()
+    player_info.name = join_as
+    player_info.uuid = this_uuid
+
+    game_logger = create_game_logger(
+        "logs/%s/" % (join_code),
+        "%s-%s" % (this_uuid, app_tag)
+    )
+    wss_api_logger = create_wss_api_logger(
+        "logs/%s/" % (join_code),
+        "%s-%s" % (this_uuid, app_tag)
+    )
+
+    # Plain ws when the probe went over plain http, as with a local stand-in
+    wss_api: WssApiHandler = handler_type(
+        wss_api_logger,
+        room.host,
+        room.code,
+        this_uuid,
+        secure=rooms.api.is_secure()
+    )
+    context = JackboxGameContext(
+        player_info,
+        wss_api,
+        game_logger
+    )
+    context.set_strategy(strategy_type)
+    entry.context = context
+
+    if capture_path is not None:
+        os.makedirs(capture_path, exist_ok=True)
+        wss_api.start_capture(
+            "%s/%s-%s.jbcap" % (capture_path, join_code, this_uuid),
+            {"name": join_as, "app_tag": app_tag}
+        )
+
+    # Join?
+    entry.status = BotStatus.JOINING
+    result = await context.join(join_as)
+    if not result:
+        # Couldn't join
+        log.info("Join was not successful, going home.")
+        entry.error = "Join was not successful"
+        entry.status = BotStatus.FAILED
+        return None
+
+    log.info(
+        "Succesfully joined room '%s' to play '%s' as '%s'!"
+        % (join_code, game_info.name, join_as)
+    )
+    return context
+
+
+async def play_bot(
+    entry: BotEntry,
+    api: HttpApiHandler,
+    log: logging.Logger,
+    uuid_node: int = None,
+    rooms: RoomProbeCache = None,
+    join_limiter: asyncio.Semaphore = None,
+    capture_path: str = None
+) -> BotStatus:
+    try:
+        # Only hold the limiter while probing and joining, playing is
+        # mostly idle waiting on the socket.
+        async with join_limiter or asyncio.Semaphore():
+            context = await join_bot(
+                entry,
+                rooms or RoomProbeCache(api),
+                log,
+                uuid_node,
+                capture_path
+            )
+        if context is not None:
+            # Joined, let's play
+            log.info("Playing '%s' until finished..." % entry.code)
+            entry.status = BotStatus.PLAYING
+            await context.play_until_finished()
+            entry.status = BotStatus.FINISHED
+        return entry.status
+    finally:
+        entry.release()
+
+
+class JackboxFleet:
+    MAX_CONCURRENT_JOINS = 16
+    REPORT_INTERVAL = 10
+
+    def __init__(
+        self,
+        bots: list,
+        api: HttpApiHandler,
+        log: logging.Logger,
+        warm_up: bool = False,
+        capture_path: str = None
+    ) -> None:
+        self.bots: list[BotEntry] = bots
+        self.api = api
+        self.log = log
+        self.warm_up = warm_up
+        self.capture_path = capture_path
+
+        self.rooms = RoomProbeCache(api)
+        self.uuid_node = uuid.getnode()
+        self.join_limiter = asyncio.Semaphore(self.MAX_CONCURRENT_JOINS)
+
+    def status_summary(self) -> dict:
+        summary = {status: 0 for status in BotStatus}
+        for bot in self.bots:
+            summary[bot.status] += 1
+        return summary
+
+    def format_summary(self) -> str:
+        summary = self.status_summary()
+        return ", ".join([
+            "%i %s" % (summary[status], status.name.lower())
+            for status in summary
+            if summary[status] > 0
+        ])
+
+    def packets_received(self) -> int:
+        return sum(
+            bot.context.api.packets_received
+            for bot in self.bots
+            if bot.context is not None
+        )
+
+    def is_done(self) -> bool:
+        return all(
+            bot.status in (BotStatus.FINISHED, BotStatus.FAILED)
+            for bot in self.bots
+        )
+
+    async def run_bot(self, entry: BotEntry) -> None:
+        try:
+            await play_bot(
+                entry,
+                self.api,
+                self.log,
+                self.uuid_node,
+                self.rooms,
+                self.join_limiter,
+                self.capture_path
+            )
+        except Exception as e:
+            self.log.error("Bot %s crashed: %s" % (entry, e))
+            entry.error = e
+            entry.status = BotStatus.FAILED
+
+    async def report(self) -> None:
+        while not self.is_done():
+            self.log.info("Fleet status: %s" % self.format_summary())
+            await asyncio.sleep(self.REPORT_INTERVAL)
+
+    async def run(self) -> dict:
+        if self.warm_up:
+            # Pay for the model before joining, not during a timed round
+            await AiTextOracle().warm_up()
+
+        self.log.info("Starting fleet of %i bots" % len(self.bots))
+        reporter = asyncio.create_task(self.report())
+        await asyncio.gather(*[
+            self.run_bot(bot)
+            for bot in self.bots
+        ])
+        reporter.cancel()
+        self.log.info("Fleet finished: %s" % self.format_summary())
+        return self.status_summary()
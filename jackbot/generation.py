@@ -0,0 +1,482 @@
+from collections import OrderedDict
+from enum import IntEnum
+import re
+import threading
+import time
+
+
+WARM_UP_PROMPT = "Q: What do you say to warm up?\nA:"
+SENTENCE_END_PATTERN = re.compile(r"[.!?\n]")
+WORD_PATTERN = re.compile(r"\w")
+
+# Per tokenizer, which token ids end an answer and which hold a word
+sentence_end_tokens: dict = {}
+
+
+class ModelBackend(IntEnum):
+    FULL = 0        # The model as loaded, in full precision
+    QUANTIZED = 1   # Linear layers dynamically quantized to int8, CPU only
+
+
+def set_torch_threads(threads: int = None, interop_threads: int = None):
+    import torch
+
+    if threads is not None:
+        torch.set_num_threads(threads)
+    if interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op work has started
+            pass
+
+
+def conv1d_to_linear(module) -> None:
+    # GPT-2 uses Conv1D for its projections, which quantize_dynamic does
+    # not know about. It is a linear layer with a transposed weight.
+    import torch
+    try:
+        from transformers.pytorch_utils import Conv1D
+    except ImportError:
+        from transformers.modeling_utils import Conv1D
+
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            nx, nf = child.weight.shape
+            linear = torch.nn.Linear(nx, nf)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            conv1d_to_linear(child)
+
+
+def quantize_model(ai) -> None:
+    import torch
+
+    model = ai.model.to("cpu").eval()
+    conv1d_to_linear(model)
+    ai.model = torch.ao.quantization.quantize_dynamic(
+        model,
+        {torch.nn.Linear},
+        dtype=torch.qint8
+    )
+
+
+def load_model(
+    model_folder: str = None,
+    backend: ModelBackend = ModelBackend.FULL,
+    threads: int = None,
+    interop_threads: int = None
+) -> tuple:
+    # Importing aitextgen drags in torch and transformers, which alone
+    # takes seconds, so it is only done once a model is actually needed.
+    started = time.perf_counter()
+    from aitextgen import aitextgen
+    imported = time.perf_counter()
+    set_torch_threads(threads, interop_threads)
+    if model_folder is None:
+        ai = aitextgen()
+    else:
+        # A local checkpoint, as saved by aitextgen or transformers
+        ai = aitextgen(model_folder=model_folder)
+    loaded = time.perf_counter()
+    timings = {
+        "import": imported - started,
+        "load": loaded - imported
+    }
+
+    if backend == ModelBackend.QUANTIZED:
+        quantize_model(ai)
+        timings["quantize"] = time.perf_counter() - loaded
+    return (ai, timings)
+
+
+def find_sentence_end_tokens(tokenizer):
+    import torch
+
+    key = id(tokenizer)
+    if key not in sentence_end_tokens:
+        # Decoding the whole vocabulary once beats decoding every step
+        count = len(tokenizer)
+        texts = tokenizer.batch_decode([[i] for i in range(count)])
+        is_end = torch.tensor([
+            SENTENCE_END_PATTERN.search(text) is not None
+            for text in texts
+        ])
+        if tokenizer.eos_token_id is not None:
+            is_end[tokenizer.eos_token_id] = True
+        has_word = torch.tensor([
+            WORD_PATTERN.search(text) is not None
+            for text in texts
+        ])
+        sentence_end_tokens[key] = (is_end, has_word)
+    return sentence_end_tokens[key]
+
+
+def cut_at_sentence_end(text: str) -> str:
+    # Ends before the first word do not count, the answer has not started
+    word = WORD_PATTERN.search(text)
+    if word is None:
+        return text
+    match = SENTENCE_END_PATTERN.search(text, word.start())
+    return text[:match.start()] if match is not None else text
+
+
+def sentence_end_criteria(tokenizer, prompt_width: int, min_new: int):
+    # Answers are cut at their first newline or end of sentence, so
+    # decoding stops once every sequence has reached one. Ends generated
+    # before min_new count too, decoding only has to get that far. Ends
+    # before the first word do not, as the answer has not started.
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    is_end, has_word = find_sentence_end_tokens(tokenizer)
+
+    class SentenceEndCriteria(StoppingCriteria):
+        def __init__(self) -> None:
+            self.started = None
+            self.ended = None
+
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            tokens = input_ids[:, -1].cpu()
+            last, word = is_end[tokens], has_word[tokens]
+            if self.started is None:
+                self.started = torch.zeros_like(word)
+                self.ended = torch.zeros_like(last)
+            self.ended = self.ended | (last & (self.started | word))
+            self.started = self.started | word
+            if input_ids.shape[1] - prompt_width < min_new:
+                return False
+            return bool(self.ended.all())
+
+    return StoppingCriteriaList([SentenceEndCriteria()])
+
+
+def generate_text(
+    ai,
+    prompt,
+    temperature,
+    min_new,
+    max_new,
+    prefix: str = ""
+) -> str:
+    if prefix and prefix_cache.lookup(ai, prefix) is not None:
+        return generate_batch(
+            ai, [prompt], temperature, min_new, max_new, prefix
+        )[0]
+    prompt = prefix + prompt
+
+    # aitextgen counts the prompt into its lengths
+    ntokens = len(ai.tokenizer(prompt)["input_ids"])
+    output = ai.generate(
+        n=1,
+        prompt=prompt,
+        temperature=temperature,
+        min_length=ntokens + min_new,
+        max_length=ntokens + max_new,
+        stopping_criteria=sentence_end_criteria(
+            ai.tokenizer,
+            ntokens,
+            min_new
+        ),
+        return_as_list=True
+    )[0]
+    return cut_at_sentence_end(output[len(prompt):])
+
+
+def continue_prefix(ai, cached: tuple, input_ids, attention_mask) -> tuple:
+    # Lays out [prefix][left padded prompt] and runs all but the last token
+    # of the prompts on top of the cached prefix. The model then only has
+    # to take the last token, which every transformers version agrees on.
+    import torch
+
+    prefix_ids, past = cached
+    count = input_ids.shape[0]
+    width = prefix_ids.shape[1]
+    input_ids = torch.cat([prefix_ids.expand(count, -1), input_ids], dim=1)
+    attention_mask = torch.cat([
+        torch.ones(
+            count,
+            width,
+            dtype=attention_mask.dtype,
+            device=attention_mask.device
+        ),
+        attention_mask
+    ], dim=1)
+
+    past = expand_past(past, count)
+    if input_ids.shape[1] - width > 1:
+        # Padding in between does not take up positions
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        with torch.no_grad():
+            past = ai.model(
+                input_ids=input_ids[:, width:-1],
+                past_key_values=past,
+                attention_mask=attention_mask[:, :-1],
+                position_ids=position_ids[:, width:-1],
+                use_cache=True
+            ).past_key_values
+    return (input_ids, attention_mask, past)
+
+
+def generate_batch(
+    ai,
+    prompts,
+    temperature,
+    min_new,
+    max_new,
+    prefix: str = ""
+) -> list:
+    import torch
+
+    tokenizer = ai.tokenizer
+    # Pad on the left so every prompt ends right where generation starts
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    # Prompts continuing a cached prefix only have their own tokens run
+    cached = None
+    if prefix and all(len(prompt) > 0 for prompt in prompts):
+        cached = prefix_cache.lookup(ai, prefix)
+    if cached is None:
+        prompts = [prefix + prompt for prompt in prompts]
+
+    encoded = tokenizer(prompts, return_tensors="pt", padding=True)
+    device = ai.get_device()
+    input_ids = encoded["input_ids"].to(device)
+    attention_mask = encoded["attention_mask"].to(device)
+
+    options = {}
+    if cached is not None:
+        input_ids, attention_mask, past = continue_prefix(
+            ai, cached, input_ids, attention_mask
+        )
+        options["past_key_values"] = past
+
+    width = input_ids.shape[1]
+    with torch.no_grad():
+        outputs = ai.model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            do_sample=True,
+            temperature=temperature,
+            min_new_tokens=min_new,
+            max_new_tokens=max_new,
+            stopping_criteria=sentence_end_criteria(
+                tokenizer,
+                width,
+                min_new
+            ),
+            pad_token_id=tokenizer.pad_token_id,
+            **options
+        )
+
+    return [
+        cut_at_sentence_end(
+            tokenizer.decode(output[width:], skip_special_tokens=True)
+        )
+        for output in outputs
+    ]
+
+
+def expand_past(past, batch_size: int):
+    # One encoding of the prompt, viewed as many without copying it
+    legacy = (
+        past.to_legacy_cache()
+        if hasattr(past, "to_legacy_cache") else
+        past
+    )
+    expanded = tuple(
+        tuple(t.expand(batch_size, *t.shape[1:]) for t in layer)
+        for layer in legacy
+    )
+    if hasattr(past, "from_legacy_cache"):
+        return type(past).from_legacy_cache(expanded)
+    return expanded
+
+
+def past_bytes(past) -> int:
+    legacy = (
+        past.to_legacy_cache()
+        if hasattr(past, "to_legacy_cache") else
+        past
+    )
+    return sum(t.numel() * t.element_size() for layer in legacy for t in layer)
+
+
+class PrefixCache:
+    MAX_BYTES = 256 * 1024 * 1024
+    MIN_TOKENS = 4      # Shorter prefixes cost more to manage than to run
+
+    def __init__(self, max_bytes: int = None) -> None:
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.entries: OrderedDict = OrderedDict()   # prefix -> (ids, past)
+        self.sizes: dict = {}                       # prefix -> bytes
+        self.size = 0
+        # Inference threads share the cache
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, ai, prefix_ids) -> object:
+        import torch
+
+        with torch.no_grad():
+            output = ai.model(input_ids=prefix_ids, use_cache=True)
+        return output.past_key_values
+
+    def lookup(self, ai, prefix: str) -> tuple:
+        # (token ids, past key values) of the prefix, or None when it is
+        # not worth caching
+        with self.lock:
+            entry = self.entries.get(prefix)
+            if entry is not None:
+                self.entries.move_to_end(prefix)
+                self.hits += 1
+                return entry
+
+        prefix_ids = ai.tokenizer(prefix, return_tensors="pt")["input_ids"]
+        if prefix_ids.shape[1] < self.MIN_TOKENS:
+            return None
+        prefix_ids = prefix_ids.to(ai.get_device())
+        entry = (prefix_ids, self.encode(ai, prefix_ids))
+        size = past_bytes(entry[1])
+
+        with self.lock:
+            self.misses += 1
+            if prefix not in self.entries and size <= self.max_bytes:
+                self.entries[prefix] = entry
+                self.sizes[prefix] = size
+                self.size += size
+                while self.size > self.max_bytes:
+                    evicted, _ = self.entries.popitem(last=False)
+                    self.size -= self.sizes.pop(evicted)
+        return entry
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.size = 0
+
+
+# One per process, like the model it holds state of
+prefix_cache = PrefixCache()
+
+
+def score_choices(
+    ai,
+    prompt: str,
+    choices: list,
+    deadline: float = None,
+    prefix: str = ""
+) -> list:
+    # None once past the deadline, as in time.time(), since nobody waits
+    # for the scores anymore. The prompt continues the prefix.
+    import torch
+
+    if deadline is not None and time.time() > deadline:
+        return None
+
+    tokenizer = ai.tokenizer
+    device = ai.get_device()
+    pad = tokenizer.eos_token_id
+
+    # Choices follow the prompt after a space, tokenize them that way
+    choice_ids = [
+        tokenizer(" " + choice.strip())["input_ids"] or [pad]
+        for choice in choices
+    ]
+    count = len(choice_ids)
+    width = max(len(ids) for ids in choice_ids)
+    lengths = torch.tensor([len(ids) for ids in choice_ids], device=device)
+    padded = torch.tensor(
+        [ids + [pad] * (width - len(ids)) for ids in choice_ids],
+        device=device
+    )
+    choice_mask = (
+        torch.arange(width, device=device)[None, :] < lengths[:, None]
+    )
+
+    # A cached prefix, such as a preamble, is not run again
+    cached = None
+    if prefix and prompt:
+        cached = prefix_cache.lookup(ai, prefix)
+    options = {}
+    prefix_width = 0
+    if cached is None:
+        prompt = prefix + prompt
+    else:
+        # A fresh view, so that running the prompt leaves the entry as is
+        options["past_key_values"] = expand_past(cached[1], 1)
+        prefix_width = cached[0].shape[1]
+
+    prompt_ids = tokenizer(prompt, return_tensors="pt")["input_ids"]
+    prompt_ids = prompt_ids.to(device)
+    with torch.no_grad():
+        # The prompt is run once, every choice continues from its cache
+        encoded = ai.model(input_ids=prompt_ids, use_cache=True, **options)
+        if deadline is not None and time.time() > deadline:
+            return None
+        attention_mask = torch.cat([
+            torch.ones(
+                count,
+                prefix_width + prompt_ids.shape[1],
+                device=device
+            ),
+            choice_mask.float()
+        ], dim=1).long()
+        output = ai.model(
+            input_ids=padded,
+            past_key_values=expand_past(encoded.past_key_values, count),
+            attention_mask=attention_mask,
+            use_cache=False
+        )
+
+    # The prompt's last position predicts the first token of each choice
+    logits = torch.cat([
+        encoded.logits[:, -1:, :].expand(count, 1, -1),
+        output.logits[:, :-1, :]
+    ], dim=1)
+    log_probs = torch.log_softmax(logits.float(), dim=-1)
+    token_log_probs = log_probs.gather(2, padded.unsqueeze(-1)).squeeze(-1)
+
+    # Normalized by length, so short answers are not favored for it
+    scores = (token_log_probs * choice_mask).sum(dim=1) / lengths
+    return scores.tolist()
+
+
+def warm_up(ai) -> float:
+    started = time.perf_counter()
+    generate_batch(ai, [WARM_UP_PROMPT], 1.0, 1, 1)
+    return time.perf_counter() - started
+
+
+# Each inference worker process loads its own copy of the model
+worker_ai = None
+worker_timings: dict = {}
+
+
+def init_worker_process(*args) -> None:
+    # Every worker loads and warms its model before it takes any job
+    global worker_ai, worker_timings
+    worker_ai, worker_timings = load_model(*args)
+    worker_timings["generate"] = warm_up(worker_ai)
+
+
+def warm_up_in_worker() -> dict:
+    return dict(worker_timings)
+
+
+def generate_text_in_worker(*args) -> str:
+    return generate_text(worker_ai, *args)
+
+
+def generate_batch_in_worker(*args) -> list:
+    return generate_batch(worker_ai, *args)
+
+
+def score_choices_in_worker(*args) -> list:
+    return score_choices(worker_ai, *args)
@@ -10,6 +10,6 @@ class JoinReason(IntEnum):
 
 
 class JoinableFlags(Flag):
-    PLAYER_SUPPORTED = 1,
-    HOST_SUPPORTED = 2,
+    PLAYER_SUPPORTED = 1
+    HOST_SUPPORTED = 2
     AUDIENCE_SUPPORTED = 3
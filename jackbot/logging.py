@@ -1,24 +1,143 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import threading
 
+from jackbot.singleton import Singleton
 
+
+MAX_LOG_BYTES = 16 * 1024 * 1024
+LOG_BACKUPS = 3
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments are often packets the reader goes on to change, so the
+        # message is made now. The rest of the formatting is left to the
+        # writer thread, off the event loop.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class PacketSampleFilter(logging.Filter):
+    def __init__(self, pipeline) -> None:
+        super().__init__()
+        self.pipeline = pipeline
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "packet", False):
+            return True
+        # Read on every record, so that changing the rate takes effect on
+        # loggers created before
+        rate = self.pipeline.packet_sample_rate
+        return rate >= 1.0 or random.random() < rate
+
+
+class RoutingHandler(logging.Handler):
+    def __init__(self, pipeline) -> None:
+        super().__init__()
+        self.pipeline = pipeline
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "release", False):
+            # Everything the bot logged before releasing is written by now
+            handler = self.pipeline.file_handlers.pop(record.name, None)
+            if handler is not None:
+                handler.close()
+            return True
+
+        handler = self.pipeline.file_handlers.get(record.name)
+        if handler is not None:
+            handler.handle(record)
+        return True
+
+
+class LogPipeline(metaclass=Singleton):
+    def __init__(self) -> None:
+        self.queue = queue.SimpleQueue()
+        self.file_handlers: dict = {}   # logger name -> its file handler
+        self.lock = threading.Lock()
+        self.listener: logging.handlers.QueueListener = None
+        self.pid = None
+        self.packet_sample_rate = 1.0
+        atexit.register(self.stop)
+
+    def ensure_started(self) -> None:
+        # A forked worker inherits the listener object, but not its thread
+        if self.listener is None or self.pid != os.getpid():
+            self.queue = queue.SimpleQueue()
+            self.listener = logging.handlers.QueueListener(
+                self.queue,
+                RoutingHandler(self)
+            )
+            self.listener.start()
+            self.pid = os.getpid()
+
+    def stop(self) -> None:
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+        for handler in list(self.file_handlers.values()):
+            handler.close()
+        self.file_handlers.clear()
+
+    def create_logger(self, name: str, file_name: str) -> logging.Logger:
+        with self.lock:
+            self.ensure_started()
+            logger = logging.getLogger(name)
+            logger.setLevel(logging.DEBUG)
+            logger.propagate = False
+
+            # Loggers are per bot, calling again must not add handlers
+            if name not in self.file_handlers:
+                path = os.path.dirname(file_name)
+                if path and not os.path.exists(path):
+                    os.makedirs(path, exist_ok=True)
+                file_handler = logging.handlers.RotatingFileHandler(
+                    file_name,
+                    maxBytes=MAX_LOG_BYTES,
+                    backupCount=LOG_BACKUPS,
+                    delay=True
+                )
+                self.file_handlers[name] = file_handler
+                for handler in list(logger.handlers):
+                    logger.removeHandler(handler)
+                queue_handler = LazyQueueHandler(self.queue)
+                queue_handler.addFilter(PacketSampleFilter(self))
+                logger.addHandler(queue_handler)
+            return logger
+
+    def release_logger(self, logger: logging.Logger) -> None:
+        # The writer closes the file once it reaches this record
+        with self.lock:
+            for queue_handler in list(logger.handlers):
+                logger.removeHandler(queue_handler)
+            if self.listener is not None:
+                self.queue.put(logging.makeLogRecord({
+                    "name": logger.name,
+                    "release": True
+                }))
+
+
+def set_packet_sample_rate(rate: float) -> None:
+    LogPipeline().packet_sample_rate = rate
+
+
+def release_logger(logger: logging.Logger) -> None:
+    LogPipeline().release_logger(logger)
+
+
+# Named after the whole file, as bots of the same name in other rooms
+# share the prefix and must not share a logger
 def create_game_logger(path, file_prefix) -> logging.Logger:
-    logger = logging.getLogger('game')
-    logger.setLevel(logging.DEBUG)
-    fn = f"{path}/{file_prefix}.game.log"
-    if not os.path.exists(path):
-        os.makedirs(path)
-    fh = logging.FileHandler(fn)
-    logger.addHandler(fh)
-    return logger
+    fn = os.path.normpath(f"{path}/{file_prefix}.game.log")
+    return LogPipeline().create_logger(f"game.{fn}", fn)
 
 
 def create_wss_api_logger(path, file_prefix) -> logging.Logger:
-    logger = logging.getLogger('api_wss')
-    logger.setLevel(logging.DEBUG)
-    fn = f"{path}/{file_prefix}.wss_api.log"
-    if not os.path.exists(path):
-        os.makedirs(path)
-    fh = logging.FileHandler(fn)
-    logger.addHandler(fh)
-    return logger
+    fn = os.path.normpath(f"{path}/{file_prefix}.wss_api.log")
+    return LogPipeline().create_logger(f"api_wss.{fn}", fn)
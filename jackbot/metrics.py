@@ -0,0 +1,234 @@
+import asyncio
+from bisect import bisect_left
+import os
+
+from jackbot.singleton import Singleton
+
+
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30
+)
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if len(names) == 0:
+        return ""
+    return "{%s}" % ",".join([
+        '%s="%s"' % (name, str(value).replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ])
+
+
+def percentiles(samples: list, points: tuple = (50, 95, 99)) -> dict:
+    if len(samples) == 0:
+        return {}
+    ordered = sorted(samples)
+    return {
+        "p%i" % point: ordered[min(
+            len(ordered) - 1,
+            int(len(ordered) * point / 100)
+        )]
+        for point in points
+    }
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name: str, help: str, label_names: tuple) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values: dict = {}  # label values -> value
+
+    def render(self) -> list:
+        lines = [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s %s" % (self.name, self.TYPE)
+        ]
+        for labels, value in self.values.items():
+            lines.append("%s%s %s" % (
+                self.name,
+                format_labels(self.label_names, labels),
+                repr(float(value))
+            ))
+        return lines
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, labels: tuple = ()) -> None:
+        self.values[labels] = value
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, labels: tuple = ()) -> None:
+        self.inc(-amount, labels)
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: tuple,
+        buckets: tuple = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, help, label_names)
+        self.buckets = buckets
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        # [count per bucket..., +Inf count, sum]
+        series = self.values.get(labels)
+        if series is None:
+            series = [0] * (len(self.buckets) + 2)
+            self.values[labels] = series
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s %s" % (self.name, self.TYPE)
+        ]
+        names = self.label_names + ("le",)
+        for labels, series in self.values.items():
+            cumulative = 0
+            bounds = [repr(float(b)) for b in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                lines.append("%s_bucket%s %i" % (
+                    self.name,
+                    format_labels(names, labels + (bound,)),
+                    cumulative
+                ))
+            label_text = format_labels(self.label_names, labels)
+            lines.append("%s_sum%s %s" % (
+                self.name, label_text, repr(float(series[-1]))
+            ))
+            lines.append("%s_count%s %i" % (
+                self.name, label_text, cumulative
+            ))
+        return lines
+
+
+class MetricsRegistry(metaclass=Singleton):
+    def __init__(self) -> None:
+        self.metrics: dict = {}
+
+    def get_or_create(self, metric_type, name, help, label_names, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = metric_type(name, help, tuple(label_names), *args)
+            self.metrics[name] = metric
+        return metric
+
+    def counter(self, name, help, label_names=()) -> Counter:
+        return self.get_or_create(Counter, name, help, label_names)
+
+    def gauge(self, name, help, label_names=()) -> Gauge:
+        return self.get_or_create(Gauge, name, help, label_names)
+
+    def histogram(
+        self,
+        name,
+        help,
+        label_names=(),
+        buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.get_or_create(
+            Histogram, name, help, label_names, buckets
+        )
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str) -> None:
+    # Written aside and renamed, so collectors never read half a file
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    temporary = "%s.%i.tmp" % (path, os.getpid())
+    with open(temporary, "w") as f:
+        f.write(MetricsRegistry().render())
+    os.replace(temporary, path)
+
+
+async def handle_metrics_request(reader, writer) -> None:
+    try:
+        # Whatever was asked for, the answer is the metrics page
+        await reader.readuntil(b"\r\n\r\n")
+        body = MetricsRegistry().render().encode("utf-8")
+        writer.write(
+            b"HTTP/1.0 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: %i\r\n\r\n" % len(body)
+        )
+        writer.write(body)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host: str, port: int) -> asyncio.AbstractServer:
+    return await asyncio.start_server(handle_metrics_request, host, port)
+
+
+async def export_metrics_periodically(path: str, interval: float) -> None:
+    while True:
+        write_metrics(path)
+        await asyncio.sleep(interval)
+
+
+class MetricsExporter:
+    EXPORT_INTERVAL = 5
+    HOST = "127.0.0.1"      # Only this machine can scrape unless told so
+
+    def __init__(
+        self,
+        port: int = None,
+        path: str = None,
+        host: str = None
+    ) -> None:
+        self.port = port
+        self.path = path
+        self.host = host or self.HOST
+        self.server: asyncio.AbstractServer = None
+        self.writer: asyncio.Task = None
+
+    async def start(self) -> None:
+        if self.port is not None:
+            self.server = await serve_metrics(self.host, self.port)
+        if self.path is not None:
+            self.writer = asyncio.create_task(export_metrics_periodically(
+                self.path,
+                self.EXPORT_INTERVAL
+            ))
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.writer is not None:
+            self.writer.cancel()
+            self.writer = None
+            # One last time, so the file holds the final numbers
+            write_metrics(self.path)
@@ -1,92 +1,387 @@
+import asyncio
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor
+)
 from enum import IntEnum
 import logging
-from math import floor
-from aitextgen import aitextgen
+import threading
+import time
 import regex
 
+from jackbot.answer_cache import AnswerCache, cache_key
+from jackbot.batching import QUEUE_WAIT, GenerationBatcher
+from jackbot.generation import (
+    ModelBackend,
+    generate_batch,
+    generate_batch_in_worker,
+    generate_text,
+    generate_text_in_worker,
+    init_worker_process,
+    load_model,
+    score_choices,
+    score_choices_in_worker,
+    warm_up,
+    warm_up_in_worker
+)
+from jackbot.metrics import MetricsRegistry
+from jackbot.prompt import BLANKS_PATTERN, PromptAnswerMethod, prompt_method
 from jackbot.singleton import Singleton
 
 
-BLANKS_PATTERN = regex.compile(r"_+")
 PUNCTUATION_PATTERN = regex.compile(r"[.!?]+")
 
+GENERATION_TIME = MetricsRegistry().histogram(
+    "jackbot_oracle_generation_seconds",
+    "Time spent in the model per call, by call kind",
+    ("kind",)
+)
+ANSWERS = MetricsRegistry().counter(
+    "jackbot_oracle_answers_total",
+    "Answers given by the oracle, by where they came from",
+    ("source",)
+)
+RANKINGS = MetricsRegistry().counter(
+    "jackbot_oracle_rankings_total",
+    "Vote rankings asked for, by outcome",
+    ("result",)
+)
 
-def count_tokens(text: str) -> None:
-    return floor(len(text)/4)
 
-
-def should_fill_in(text: str) -> bool:
-    return len(BLANKS_PATTERN.findall(text)) > 0
+def clean_answer(ai_generated: str) -> str:
+    stripped = ai_generated.replace("\n", " ").strip()
+    return PUNCTUATION_PATTERN.split(stripped)[0].strip()
 
 
 def output_to_answer(prompt: str, aiout: str) -> str:
-    ai_generated = aiout[len(prompt):]
-    stripped = ai_generated.replace("\n", " ").strip()
-    return PUNCTUATION_PATTERN.split(stripped)[0].strip()
+    return clean_answer(aiout[len(prompt):])
+
 
+def run_timed(function, *args) -> tuple:
+    # Wall clock, as the worker may be another process
+    return (time.time(), function(*args))
 
-class PromptAnswerMethod(IntEnum):
-    FILLIN_BLANKS = 0
-    QUIP = 1
+
+class InferenceMode(IntEnum):
+    INLINE = 0      # Generate on the event loop, blocks everything else
+    THREAD = 1      # Generate in a thread pool sharing one model
+    PROCESS = 2     # Generate in worker processes with a model each
 
 
 class AiTextOracle(metaclass=Singleton):
-    def __init__(self, logger: logging.Logger = None) -> None:
-        self.ai = aitextgen()
+    MIN_ANSWER_TOKENS = 2
+    MAX_ANSWER_TOKENS = 8
+    RANK_BUDGET = 2.0
+    BACKEND = ModelBackend.FULL
+    TORCH_THREADS = None            # Left to torch unless set
+    TORCH_INTEROP_THREADS = None
+    PREAMBLE = ""                   # Few-shot examples put before prompts
+    ANSWER_CACHE_PATH = "cache/answers.sqlite3"
+
+    def __init__(
+        self,
+        logger: logging.Logger = None,
+        mode: InferenceMode = InferenceMode.THREAD,
+        workers: int = 1,
+        max_batch_size: int = GenerationBatcher.MAX_BATCH_SIZE,
+        batch_window: float = GenerationBatcher.BATCH_WINDOW,
+        cache: AnswerCache = None,
+        model_folder: str = None,
+        backend: ModelBackend = None,
+        threads: int = None,
+        interop_threads: int = None,
+        preamble: str = None
+    ) -> None:
         self.ai_temperature = 2.4
+        self.preamble = preamble if preamble is not None else self.PREAMBLE
+        self.mode = mode
+        self.backend = backend if backend is not None else self.BACKEND
+        self.model_options = (
+            model_folder,
+            self.backend,
+            threads or self.TORCH_THREADS,
+            interop_threads or self.TORCH_INTEROP_THREADS
+        )
+        self.cache = (
+            cache
+            if cache is not None else
+            AnswerCache(self.ANSWER_CACHE_PATH)
+        )
 
         self.logger = logger
         if logger is None:
             self.logger = logging.getLogger("aitextgen")
             self.logger.setLevel(logging.INFO)
 
-        pass
+        # The model is loaded on first use or by warm_up, never on import
+        self.ai = None
+        self.ai_lock = threading.Lock()
+        self.timings: dict = {}
 
-    async def generate_answer(self, prompt: str) -> str:
-        method = (
-            PromptAnswerMethod.FILLIN_BLANKS
-            if should_fill_in(prompt) else
-            PromptAnswerMethod.QUIP
+        self.workers = workers
+        self.executor: Executor = None
+        # Rankings run apart from answers, which never wait behind them
+        self.rank_executor: Executor = None
+        match mode:
+            case InferenceMode.INLINE:
+                pass
+            case InferenceMode.THREAD:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=workers,
+                    thread_name_prefix="oracle"
+                )
+                self.rank_executor = ThreadPoolExecutor(
+                    max_workers=1,
+                    thread_name_prefix="oracle-rank"
+                )
+            case InferenceMode.PROCESS:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=init_worker_process,
+                    initargs=self.model_options
+                )
+
+        # Bots voting on the same choices share one ranking
+        self.rankings: dict = {}    # (prompt, choices) -> task of scores
+
+        # Prompts arriving together are generated in one batched pass
+        self.batcher: GenerationBatcher = None
+        if max_batch_size > 1:
+            self.batcher = GenerationBatcher(
+                self.generate_many,
+                batch_window,
+                max_batch_size
+            )
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.rank_executor is not None:
+            self.rank_executor.shutdown(wait=False, cancel_futures=True)
+            self.rank_executor = None
+        self.cache.close()
+
+    def model(self):
+        if self.ai is None:
+            with self.ai_lock:
+                if self.ai is None:
+                    ai, timings = load_model(*self.model_options)
+                    self.timings.update(timings)
+                    self.logger.info(
+                        "Model imported in %.2fs and loaded in %.2fs (%s)"
+                        % (
+                            timings["import"],
+                            timings["load"],
+                            self.backend.name.lower()
+                        )
+                    )
+                    self.ai = ai
+        return self.ai
+
+    def run_with_model(self, function, *args):
+        return function(self.model(), *args)
+
+    async def warm_up(self) -> dict:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        match self.mode:
+            case InferenceMode.INLINE:
+                self.timings["generate"] = warm_up(self.model())
+            case InferenceMode.THREAD:
+                self.timings["generate"] = await loop.run_in_executor(
+                    self.executor, self.run_with_model, warm_up
+                )
+            case InferenceMode.PROCESS:
+                # Workers warm up as they start. Jobs submitted together
+                # find no idle worker, so each spawns another process.
+                results = await asyncio.gather(*[
+                    loop.run_in_executor(self.executor, warm_up_in_worker)
+                    for _ in range(self.workers)
+                ])
+                for name in results[0]:
+                    self.timings[name] = max(r[name] for r in results)
+        self.timings["warm_up"] = time.perf_counter() - started
+        self.logger.info("Oracle warmed up: %s" % ", ".join([
+            "%s %.2fs" % (name, seconds)
+            for name, seconds in self.timings.items()
+        ]))
+        return self.timings
+
+    async def run_inference(
+        self,
+        function,
+        worker_function,
+        *args,
+        executor: Executor = None
+    ):
+        loop = asyncio.get_running_loop()
+        executor = executor or self.executor
+        started = time.perf_counter()
+        try:
+            match self.mode:
+                case InferenceMode.INLINE:
+                    return function(self.model(), *args)
+                case InferenceMode.THREAD:
+                    return await self.run_queued(
+                        loop, executor, self.run_with_model, function, *args
+                    )
+                case InferenceMode.PROCESS:
+                    return await self.run_queued(
+                        loop, executor, worker_function, *args
+                    )
+        finally:
+            GENERATION_TIME.observe(
+                time.perf_counter() - started,
+                (function.__name__,)
+            )
+
+    async def run_queued(self, loop, executor, function, *args):
+        # Calls queue up for executor workers, batched or not
+        submitted = time.time()
+        started, result = await loop.run_in_executor(
+            executor, run_timed, function, *args
+        )
+        QUEUE_WAIT.observe(max(0.0, started - submitted), ("executor",))
+        return result
+
+    async def generate_many(
+        self,
+        prompts,
+        min_new,
+        max_new,
+        prefix: str = ""
+    ) -> list:
+        return await self.run_inference(
+            generate_batch,
+            generate_batch_in_worker,
+            prompts, self.ai_temperature, min_new, max_new, prefix
         )
+
+    async def generate(self, prompt, min_new, max_new, prefix="") -> str:
+        # The prompt continues the prefix, whose encoding the model keeps
+        if self.batcher is not None:
+            return await self.batcher.submit(prompt, min_new, max_new, prefix)
+        return await self.run_inference(
+            generate_text,
+            generate_text_in_worker,
+            prompt, self.ai_temperature, min_new, max_new, prefix
+        )
+
+    async def score(
+        self,
+        prefix: str,
+        prompt: str,
+        choices: tuple,
+        deadline: float
+    ) -> list:
+        # Worker processes have no spare model, but skip late rankings
+        try:
+            return await self.run_inference(
+                score_choices,
+                score_choices_in_worker,
+                prompt, list(choices), deadline, prefix,
+                executor=self.rank_executor
+            )
+        except Exception as e:
+            self.logger.error("Could not rank choices: %s" % e)
+            return None
+        finally:
+            self.rankings.pop((prefix, prompt, choices), None)
+
+    async def rank_choices(
+        self,
+        prompt: str,
+        choices: list,
+        budget: float = None
+    ) -> list:
+        # Scores choices by how likely the model finds them as answers to
+        # the prompt, or None if that takes longer than the budget
+        budget = budget or self.RANK_BUDGET
+        prefix, rest = self.answer_template(prompt_method(prompt), prompt)
+        key = (prefix, rest.rstrip(), tuple(choices))
+        ranking = self.rankings.get(key)
+        if ranking is None:
+            ranking = asyncio.ensure_future(
+                self.score(*key, time.time() + budget)
+            )
+            self.rankings[key] = ranking
+        try:
+            scores = await asyncio.wait_for(asyncio.shield(ranking), budget)
+            RANKINGS.inc(1, ("ranked" if scores is not None else "error",))
+            return scores
+        except asyncio.TimeoutError:
+            RANKINGS.inc(1, ("timeout",))
+            return None
+
+    async def generate_answer(self, prompt: str) -> str:
+        answer, _ = await self.find_answer(prompt)
+        return answer
+
+    async def find_answer(self, prompt: str) -> tuple:
+        # (answer, whether it came from the cache rather than the model)
+        method = prompt_method(prompt)
         self.logger.debug("PROMPT: %s" % prompt)
         self.logger.debug("METHOD: %s" % method)
+
+        key = cache_key(method, prompt)
+        answer = await self.cache.pick(key)
+        if answer is not None:
+            self.logger.debug("CACHED ANSWER: %s" % answer)
+            ANSWERS.inc(1, ("cache",))
+            return (answer, True)
+
+        answer = await self.answer_with(method, prompt)
+        ANSWERS.inc(1, ("model",))
+        if len(answer) > 0:
+            await self.cache.add(key, answer)
+        return (answer, False)
+
+    async def answer_with(self, method: PromptAnswerMethod, prompt) -> str:
         match method:
             case PromptAnswerMethod.FILLIN_BLANKS:
                 return await self.answer_fillin_blanks(prompt)
             case PromptAnswerMethod.QUIP:
                 return await self.answer_quip(prompt)
 
-    async def answer_fillin_blanks(self, prompt: str) -> str:
-        pieces = BLANKS_PATTERN.split(prompt)
-
-        p = pieces[0]
+    def answer_template(self, method: PromptAnswerMethod, prompt) -> tuple:
+        # (prefix, rest) of what the model continues from to answer the
+        # prompt. The prefix is the same for many prompts, so its encoding
+        # is kept. The rest starts with its space, as GPT-2 tokenizes it.
+        match method:
+            case PromptAnswerMethod.FILLIN_BLANKS:
+                return (self.preamble, BLANKS_PATTERN.split(prompt)[0])
+            case PromptAnswerMethod.QUIP:
+                return (self.preamble + "Q:", " %s?\nA:" % prompt)
 
-        ntokens = count_tokens(p)
-        min_n = ntokens + 2
-        max_n = ntokens + 8
+    async def answer_fillin_blanks(self, prompt: str) -> str:
+        prefix, p = self.answer_template(
+            PromptAnswerMethod.FILLIN_BLANKS,
+            prompt
+        )
 
-        return await self.get_clean_answer(p, min_n, max_n)
+        return await self.get_clean_answer(
+            p,
+            self.MIN_ANSWER_TOKENS,
+            self.MAX_ANSWER_TOKENS,
+            prefix
+        )
 
     async def answer_quip(self, prompt: str) -> str:
-        p = "Q: %s?\nA:" % prompt
+        prefix, p = self.answer_template(PromptAnswerMethod.QUIP, prompt)
 
-        ntokens = count_tokens(p)
-        min_n = ntokens + 2
-        max_n = ntokens + 8
-
-        return await self.get_clean_answer(p, min_n, max_n)
+        return await self.get_clean_answer(
+            p,
+            self.MIN_ANSWER_TOKENS,
+            self.MAX_ANSWER_TOKENS,
+            prefix
+        )
 
-    async def get_clean_answer(self, prompt, min_tokens, max_tokens) -> str:
-        output = self.ai.generate(
-            n=1,
-            prompt=prompt,
-            temperature=self.ai_temperature,
-            min_length=min_tokens,
-            max_length=max_tokens,
-            return_as_list=True
-        )[0]
+    async def get_clean_answer(self, prompt, min_new, max_new, prefix=""):
+        output = await self.generate(prompt, min_new, max_new, prefix)
 
-        answer = output_to_answer(prompt, output)
+        answer = clean_answer(output)
         self.logger.debug("ANSWER: %s" % answer)
         self.logger.debug("LENGTH: %i" % len(answer))
         return answer
@@ -0,0 +1,22 @@
+from enum import IntEnum
+import regex
+
+
+BLANKS_PATTERN = regex.compile(r"_+")
+
+
+def should_fill_in(text: str) -> bool:
+    return len(BLANKS_PATTERN.findall(text)) > 0
+
+
+class PromptAnswerMethod(IntEnum):
+    FILLIN_BLANKS = 0
+    QUIP = 1
+
+
+def prompt_method(prompt: str) -> PromptAnswerMethod:
+    return (
+        PromptAnswerMethod.FILLIN_BLANKS
+        if should_fill_in(prompt) else
+        PromptAnswerMethod.QUIP
+    )
@@ -1,3 +1,6 @@
+import asyncio
+import time
+
 from jackbot.api.http import HttpApiHandler
 from jackbot.utils import str_list_public
 
@@ -45,8 +48,69 @@ class RoomInfo:
 
 async def try_find_room(api: HttpApiHandler, code: str) -> RoomProbeData:
     msg = await api.fetch(f"rooms/{code}")
-    probe = RoomProbeData.from_json(msg.json())
+    probe = RoomProbeData.from_json(msg)
     probe.code = code
     if (probe.ok):
         return (probe, RoomInfo(probe.body))
     return (probe, None)
+
+
+class RoomProbeCache:
+    FOUND_TTL = 5
+    NOT_FOUND_TTL = 2
+    SWEEP_SIZE = 1024
+
+    def __init__(
+        self,
+        api: HttpApiHandler,
+        found_ttl: float = None,
+        not_found_ttl: float = None
+    ) -> None:
+        self.api = api
+        self.found_ttl = found_ttl or self.FOUND_TTL
+        self.not_found_ttl = not_found_ttl or self.NOT_FOUND_TTL
+
+        self.entries: dict = {}     # code -> (expires at, (probe, room))
+        self.in_flight: dict = {}   # code -> task probing the room
+        self.requests = 0
+
+    def __sweep(self, now: float) -> None:
+        self.entries = {
+            code: entry
+            for code, entry in self.entries.items()
+            if entry[0] > now
+        }
+
+    def __store(self, code: str, result: tuple) -> None:
+        probe, _ = result
+        ttl = self.found_ttl if probe.ok else self.not_found_ttl
+        now = time.monotonic()
+        if len(self.entries) >= self.SWEEP_SIZE:
+            self.__sweep(now)
+        self.entries[code] = (now + ttl, result)
+
+    async def __probe(self, code: str) -> tuple:
+        try:
+            self.requests += 1
+            result = await try_find_room(self.api, code)
+            self.__store(code, result)
+            return result
+        finally:
+            del self.in_flight[code]
+
+    def invalidate(self, code: str) -> None:
+        self.entries.pop(code.upper(), None)
+
+    async def find_room(self, code: str) -> tuple:
+        code = code.upper()
+        cached = self.entries.get(code)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        # Every concurrent prober of the same room awaits the same request,
+        # shielded so one cancelled bot does not cancel it for the rest.
+        task = self.in_flight.get(code)
+        if task is None:
+            task = asyncio.ensure_future(self.__probe(code))
+            self.in_flight[code] = task
+        return await asyncio.shield(task)
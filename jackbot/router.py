@@ -0,0 +1,95 @@
+from jackbot.api.wss.codec import LazyPacket
+
+
+class Message:
+    __slots__ = ("opcode", "packet")
+
+    def __init__(self, opcode: str, packet: LazyPacket) -> None:
+        self.opcode = opcode
+        self.packet = packet
+
+    @property
+    def result(self):
+        return self.packet.result
+
+    @property
+    def data(self) -> dict:
+        return self.packet.data
+
+
+class ObjectMessage:
+    __slots__ = ("key", "packet", "_result")
+
+    def __init__(
+        self,
+        key: str,
+        packet: LazyPacket = None,
+        result: dict = None
+    ) -> None:
+        # Either backed by a packet, decoded on first read, or by a result
+        # that was decoded already, as with the entities of a welcome.
+        self.key = key
+        self.packet = packet
+        self._result = result
+
+    @property
+    def result(self) -> dict:
+        if self._result is None:
+            self._result = self.packet.result
+        return self._result
+
+    @property
+    def val(self):
+        return self.result["val"]
+
+    @property
+    def version(self) -> int:
+        return self.result.get("version")
+
+
+class MessageRouter:
+    def __init__(self) -> None:
+        self.opcode_routes: dict = {}   # opcode -> handlers
+        self.object_routes: dict = {}   # object key -> handlers
+        self.unknown_opcode = None
+        self.unknown_object = None
+
+    def on_opcode(self, opcode: str, handler) -> None:
+        self.opcode_routes.setdefault(opcode, []).append(handler)
+
+    def on_object(self, key: str, handler) -> None:
+        self.object_routes.setdefault(key, []).append(handler)
+
+    def routes_object(self, key: str) -> bool:
+        return key in self.object_routes
+
+    def on_unknown(self, opcode_handler=None, object_handler=None) -> None:
+        self.unknown_opcode = opcode_handler
+        self.unknown_object = object_handler
+
+    async def dispatch(self, packet: LazyPacket) -> bool:
+        opcode = packet.opcode
+        if opcode == "object":
+            return await self.dispatch_object(
+                ObjectMessage(packet.key, packet)
+            )
+
+        handlers = self.opcode_routes.get(opcode)
+        message = Message(opcode, packet)
+        if handlers is None:
+            if self.unknown_opcode is not None:
+                await self.unknown_opcode(message)
+            return False
+        for handler in handlers:
+            await handler(message)
+        return True
+
+    async def dispatch_object(self, message: ObjectMessage) -> bool:
+        handlers = self.object_routes.get(message.key)
+        if handlers is None:
+            if self.unknown_object is not None:
+                await self.unknown_object(message)
+            return False
+        for handler in handlers:
+            await handler(message)
+        return True
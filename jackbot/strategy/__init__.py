@@ -1,11 +1,11 @@
+from importlib.metadata import entry_points
 import json
 
-from jackbot.api.wss.v2_impl import V2WssApiHandler
 from jackbot.context import GameStrategy, JackboxGameContext
 from jackbot.join_enums import JoinReason
 from jackbot.room import RoomInfo
 from jackbot.singleton import Singleton
-from jackbot.utils import str_list_public
+from jackbot.utils import import_object, str_list_public
 
 
 class DummyStrategy(GameStrategy):
@@ -16,20 +16,43 @@ class DummyStrategy(GameStrategy):
         return JoinReason.GAME_CAN_JOIN
 
     async def on_room_update(self, value) -> None:
-        self.context.log.info("Received room update! - %s" % value)
+        self.context.log.info("Received room update! - %s", value)
 
     async def on_game_update(self, value) -> None:
-        self.context.log.info("Received game update! - %s" % value)
+        self.context.log.info("Received game update! - %s", value)
 
 
 class GameInfo:
+    DEFAULT_HANDLER = "jackbot.api.wss.v2_impl:V2WssApiHandler"
+
     def __init__(self) -> None:
         self.name = None
         self.app_tag = None
         self.app_uuid = None
         self.pack = None
-        self.strategy_type = None
-        self.handler_type = None
+        # Either a class, or "module:Class" imported on first use
+        self.strategy = DummyStrategy
+        self.handler = self.DEFAULT_HANDLER
+
+    @property
+    def strategy_type(self):
+        if isinstance(self.strategy, str):
+            self.strategy = import_object(self.strategy)
+        return self.strategy
+
+    @strategy_type.setter
+    def strategy_type(self, strategy_type) -> None:
+        self.strategy = strategy_type
+
+    @property
+    def handler_type(self):
+        if isinstance(self.handler, str):
+            self.handler = import_object(self.handler)
+        return self.handler
+
+    @handler_type.setter
+    def handler_type(self, handler_type) -> None:
+        self.handler = handler_type
 
     def __str__(self) -> str:
         var_info = str_list_public(self, 16)
@@ -38,15 +61,21 @@ class GameInfo:
 
 class JackboxGameRegistry(metaclass=Singleton):
     DEFAULT_CLIENT = "DEFAULT"
+    ENTRY_POINT_GROUP = "jackbot.strategies"
     SINGLETON_INSTANCE = None
 
     def __init__(self):
-        self.tag_database = {
-            f"{self.DEFAULT_CLIENT}": (DummyStrategy, V2WssApiHandler)
-        }
-        self.uuid_database = {
-            f"{self.DEFAULT_CLIENT}": (DummyStrategy, V2WssApiHandler)
-        }
+        default = GameInfo()
+        default.name = self.DEFAULT_CLIENT
+        default.app_tag = self.DEFAULT_CLIENT
+
+        self.tag_database = {self.DEFAULT_CLIENT: default}
+        self.uuid_database = {}
+
+    def add(self, info: GameInfo) -> None:
+        self.tag_database[info.app_tag] = info
+        if info.app_uuid is not None:
+            self.uuid_database[info.app_uuid] = info
 
     def load_from(self, json_file_path: str) -> None:
         with open(json_file_path, 'r') as f:
@@ -59,27 +88,32 @@ class JackboxGameRegistry(metaclass=Singleton):
                 info.app_tag = game["tag"]
                 info.app_uuid = game["uuid"]
                 info.pack = game["pack"]
-                info.strategy_type = DummyStrategy
-                info.handler_type = V2WssApiHandler
-
-                self.tag_database[info.app_tag] = info
-                self.uuid_database[info.app_uuid] = info
+                info.strategy = game.get("strategy", DummyStrategy)
+                info.handler = game.get("handler", GameInfo.DEFAULT_HANDLER)
+                self.add(info)
+
+        self.discover()
+
+    def discover(self) -> None:
+        # Installed packages can ship strategies as entry points named after
+        # the app tag, e.g. quiplash2 = "mypackage.quiplash2:Strategy". Only
+        # the entry point is read here, its module is imported on join. A
+        # strategy named in the JSON file takes precedence.
+        for entry_point in entry_points(group=self.ENTRY_POINT_GROUP):
+            info = self.tag_database.get(entry_point.name)
+            if info is None:
+                info = GameInfo()
+                info.name = entry_point.name
+                info.app_tag = entry_point.name
+                self.add(info)
+            if info.strategy is DummyStrategy:
+                info.strategy = entry_point.value
 
     def register(self, app_tag: str, strategy_type) -> None:
         self.tag_database[app_tag].strategy_type = strategy_type
 
     def get_game_by_tag(self, app_tag: str) -> GameInfo:
-        selector = app_tag
-        return (
-            self.tag_database[selector]
-            if app_tag in self.tag_database else
-            None
-        )
+        return self.tag_database.get(app_tag)
 
     def get_game_by_uuid(self, app_id: str) -> GameInfo:
-        selector = app_id
-        return (
-            self.tag_database[selector]
-            if selector in self.tag_database else
-            None
-        )
+        return self.uuid_database.get(app_id)
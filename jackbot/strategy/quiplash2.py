@@ -1,9 +1,25 @@
+from enum import IntEnum
 import random
+import time
+from jackbot.answering import answer_before
 from jackbot.context import GameStrategy, JackboxGameContext
 from jackbot.orcale import AiTextOracle
 
 
+class VoteMode(IntEnum):
+    RANDOM = 0
+    ORACLE = 1      # Vote for what the model finds likeliest, within budget
+
+
+def choice_text(choice) -> str:
+    if type(choice) is dict:
+        return str(choice.get("answer", ""))
+    return str(choice)
+
+
 class Quiplash2VotingState:
+    __slots__ = ("choices", "question_id", "prompt")
+
     def __init__(self, json: dict) -> None:
         self.choices: dict = json["choices"]
         self.question_id: int = json["question"]["id"]
@@ -11,21 +27,33 @@ class Quiplash2VotingState:
 
 
 class Quiplash2Strategy(GameStrategy):
+    VOTE_MODE = VoteMode.ORACLE
+    VOTE_BUDGET = 2.0
+    ANSWER_TIME = 60.0      # Used when the game state carries no timer
+    DEADLINE_MARGIN = 1.5   # Left for the answer to reach the game
+
     def __init__(self, context: JackboxGameContext) -> None:
         super().__init__(context)
 
+        # The voting state is only built once we actually get to vote
+        self.vote_value: dict = None
         self.vote_state: Quiplash2VotingState = None
 
     async def game_vote(self) -> None:
+        if self.vote_state is None and self.vote_value is not None:
+            self.vote_state = Quiplash2VotingState(self.vote_value)
+
         if self.vote_state is not None:
             prompt = self.vote_state.prompt
             choices = self.vote_state.choices
 
-            choice = None
+            keys = None
             if type(choices) is list:
-                choice = random.choice(list(range(len(choices))))
+                keys = list(range(len(choices)))
             else:  # Should be a dict
-                choice = random.choice(list(choices.keys()))
+                keys = list(choices.keys())
+
+            choice = await self.pick_choice(prompt, choices, keys)
 
             self.context.log.info(
                 "Voting '%s' -> '%s' for prompt \"%s\""
@@ -39,12 +67,42 @@ class Quiplash2Strategy(GameStrategy):
                 "Error voting, there were no state to infer from!"
             )
 
-    async def game_answer_question(self, question: dict) -> None:
+    async def pick_choice(self, prompt: str, choices, keys: list):
+        if self.VOTE_MODE == VoteMode.ORACLE and len(keys) > 1:
+            scores = await AiTextOracle().rank_choices(
+                prompt,
+                [choice_text(choices[key]) for key in keys],
+                self.VOTE_BUDGET
+            )
+            if scores is not None:
+                return keys[scores.index(max(scores))]
+            self.context.log.info("No ranking within budget, voting randomly")
+        return random.choice(keys)
+
+    def answer_deadline(self, value: dict) -> float:
+        # Counted from when the question arrived, not from when we got to it
+        started = self.context.received_at or time.perf_counter()
+        timer = value.get("timer")
+        seconds = (
+            float(timer)
+            if type(timer) in (int, float) and timer > 0 else
+            self.ANSWER_TIME
+        )
+        return started + seconds - self.DEADLINE_MARGIN
+
+    async def game_answer_question(
+        self,
+        question: dict,
+        deadline: float
+    ) -> None:
         if question is not None:  # Make an answer
             qid = question["id"]
             prompt = question["prompt"]
 
-            answer = await AiTextOracle().generate_answer(prompt)
+            answer, tier = await answer_before(prompt, deadline)
+            self.context.log.debug(
+                "Answering from %s: %s", tier.name.lower(), answer
+            )
 
             await self.act({
                 "answer": answer,
@@ -58,7 +116,9 @@ class Quiplash2Strategy(GameStrategy):
             state = value["state"]
             match state:
                 case "Gameplay_Vote" | "Gameplay_R3Vote":
-                    self.vote_state = Quiplash2VotingState(value)
+                    if value is not self.vote_value:
+                        self.vote_value = value
+                        self.vote_state = None
                 case _:
                     pass
 
@@ -69,7 +129,10 @@ class Quiplash2Strategy(GameStrategy):
                 case "Gameplay_AnswerQuestion":
                     question = value["question"]
                     if question is not None:
-                        await self.game_answer_question(question)
+                        await self.game_answer_question(
+                            question,
+                            self.answer_deadline(value)
+                        )
                     else:
                         pass
                 case "Gameplay_Vote" | "Gameplay_R3Vote":
@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+from jackbot.api.http.v2_impl import create_http_api
+from jackbot.fleet import BotEntry, BotStatus, JackboxFleet
+from jackbot.metrics import MetricsExporter
+
+
+def shard_manifest(bots: list, shards: int) -> list:
+    # Keep bots heading for the same room in one worker, so they can share
+    # room probes, and hand each room to the least loaded shard.
+    rooms = {}
+    for bot in bots:
+        rooms.setdefault(bot.code, []).append(bot)
+
+    result = [[] for _ in range(shards)]
+    for code in sorted(rooms, key=lambda c: len(rooms[c]), reverse=True):
+        smallest = min(result, key=len)
+        smallest.extend(rooms[code])
+    return [shard for shard in result if len(shard) > 0]
+
+
+def bot_key(code: str, name: str) -> str:
+    return "%s/%s" % (code, name)
+
+
+async def async_fleet_worker(
+    worker_id: int,
+    bots: list,
+    health_queue,
+    report_interval: float,
+    warm_up: bool,
+    exporter: MetricsExporter,
+    ecast_host: str = None
+) -> None:
+    log = logging.getLogger("worker-%i" % worker_id)
+    api = create_http_api(log, ecast_host)
+    fleet = JackboxFleet(bots, api, log, warm_up)
+    started = time.monotonic()
+
+    def report(final=False) -> None:
+        health_queue.put({
+            "worker": worker_id,
+            "pid": os.getpid(),
+            "uptime": time.monotonic() - started,
+            "summary": {
+                status.name: count
+                for status, count in fleet.status_summary().items()
+            },
+            "done": [
+                bot_key(bot.code, bot.name)
+                for bot in fleet.bots
+                if bot.status in (BotStatus.FINISHED, BotStatus.FAILED)
+            ],
+            "packets": fleet.packets_received(),
+            "final": final
+        })
+
+    async def heartbeat() -> None:
+        while True:
+            report()
+            await asyncio.sleep(report_interval)
+
+    beat = asyncio.create_task(heartbeat())
+    await exporter.start()
+    try:
+        await fleet.run()
+    finally:
+        beat.cancel()
+        await api.close()
+        await exporter.stop()
+        report(final=True)
+
+
+def fleet_worker(
+    worker_id: int,
+    bots: list,
+    health_queue,
+    report_interval: float,
+    warm_up: bool,
+    exporter: MetricsExporter,
+    setup=None,
+    ecast_host: str = None
+) -> None:
+    if setup is not None:
+        setup()
+    entries = [BotEntry(code, name) for code, name in bots]
+    asyncio.run(async_fleet_worker(
+        worker_id,
+        entries,
+        health_queue,
+        report_interval,
+        warm_up,
+        exporter,
+        ecast_host
+    ))
+
+
+class WorkerHealth:
+    def __init__(self, worker_id: int, bots: list) -> None:
+        self.worker_id = worker_id
+        self.bots: list = bots
+        self.process: multiprocessing.Process = None
+        self.pid: int = None
+        self.restarts = 0
+        self.last_seen: float = None
+        self.summary: dict = {}
+        self.done: set = set()
+        self.packets = 0
+        self.packets_per_second = 0.0
+        self.finished = False
+
+    def remaining_bots(self) -> list:
+        return [
+            (code, name)
+            for code, name in self.bots
+            if bot_key(code, name) not in self.done
+        ]
+
+    def update(self, report: dict) -> None:
+        now = time.monotonic()
+        # Packet counters restart along with the worker process
+        if self.last_seen is not None and report["pid"] == self.pid:
+            elapsed = now - self.last_seen
+            if elapsed > 0:
+                self.packets_per_second = (
+                    (report["packets"] - self.packets) / elapsed
+                )
+        self.pid = report["pid"]
+        self.last_seen = now
+        self.summary = report["summary"]
+        self.done.update(report["done"])
+        self.packets = report["packets"]
+        self.finished = report["final"]
+
+    def __str__(self) -> str:
+        active = ", ".join([
+            "%i %s" % (count, status.lower())
+            for status, count in self.summary.items()
+            if count > 0
+        ])
+        return "Worker %i (pid %s, restarts %i): %s - %.1f packets/s" % (
+            self.worker_id,
+            self.pid,
+            self.restarts,
+            active,
+            self.packets_per_second
+        )
+
+
+class FleetSupervisor:
+    REPORT_INTERVAL = 5
+    HEARTBEAT_TIMEOUT = 60
+    MAX_RESTARTS = 5
+
+    def __init__(
+        self,
+        bots: list,
+        log: logging.Logger,
+        workers: int = None,
+        setup=None,
+        start_method: str = None,
+        warm_up: bool = False,
+        metrics_port: int = None,
+        metrics_dir: str = None,
+        ecast_host: str = None,
+        metrics_host: str = None
+    ) -> None:
+        self.log = log
+        self.setup = setup
+        self.warm_up = warm_up
+        self.ecast_host = ecast_host
+        self.metrics_port = metrics_port
+        self.metrics_dir = metrics_dir
+        self.metrics_host = metrics_host
+        self.mp = multiprocessing.get_context(start_method)
+        self.health_queue = self.mp.Queue()
+
+        shards = shard_manifest(bots, workers or os.cpu_count() or 1)
+        self.workers = [
+            WorkerHealth(i, [(bot.code, bot.name) for bot in shard])
+            for i, shard in enumerate(shards)
+        ]
+
+    def worker_exporter(self, worker: WorkerHealth) -> MetricsExporter:
+        return MetricsExporter(
+            (
+                self.metrics_port + worker.worker_id
+                if self.metrics_port is not None else
+                None
+            ),
+            (
+                "%s/worker-%i.prom" % (self.metrics_dir, worker.worker_id)
+                if self.metrics_dir is not None else
+                None
+            ),
+            self.metrics_host
+        )
+
+    def start_worker(self, worker: WorkerHealth) -> None:
+        bots = worker.remaining_bots()
+        worker.process = self.mp.Process(
+            target=fleet_worker,
+            args=(
+                worker.worker_id,
+                bots,
+                self.health_queue,
+                self.REPORT_INTERVAL,
+                self.warm_up,
+                self.worker_exporter(worker),
+                self.setup,
+                self.ecast_host
+            ),
+            name="jackbot-worker-%i" % worker.worker_id,
+            daemon=True
+        )
+        worker.process.start()
+        worker.pid = worker.process.pid
+        worker.last_seen = time.monotonic()
+        self.log.info(
+            "Started worker %i (pid %i) with %i bots"
+            % (worker.worker_id, worker.pid, len(bots))
+        )
+
+    def restart_worker(self, worker: WorkerHealth, reason: str) -> None:
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join()
+
+        if len(worker.remaining_bots()) == 0:
+            worker.finished = True
+            return
+        if worker.restarts >= self.MAX_RESTARTS:
+            self.log.error(
+                "Worker %i %s, giving up after %i restarts"
+                % (worker.worker_id, reason, worker.restarts)
+            )
+            worker.finished = True
+            return
+
+        worker.restarts += 1
+        self.log.warning(
+            "Worker %i %s, restarting it with %i bots"
+            % (worker.worker_id, reason, len(worker.remaining_bots()))
+        )
+        self.start_worker(worker)
+
+    def drain_reports(self, timeout: float) -> None:
+        try:
+            report = self.health_queue.get(timeout=timeout)
+            while True:
+                self.workers[report["worker"]].update(report)
+                report = self.health_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def check_workers(self) -> None:
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.finished:
+                continue
+            if not worker.process.is_alive():
+                exitcode = worker.process.exitcode
+                if exitcode == 0:
+                    # Might have died right after its final report was read
+                    worker.finished = len(worker.remaining_bots()) == 0
+                    if worker.finished:
+                        continue
+                self.restart_worker(
+                    worker,
+                    "died with exit code %s" % exitcode
+                )
+            elif now - worker.last_seen > self.HEARTBEAT_TIMEOUT:
+                self.restart_worker(worker, "stopped reporting")
+
+    def health(self) -> list:
+        return [str(worker) for worker in self.workers]
+
+    def total_packets_per_second(self) -> float:
+        return sum(worker.packets_per_second for worker in self.workers)
+
+    def run(self) -> None:
+        self.log.info(
+            "Supervising %i workers for %i bots" % (
+                len(self.workers),
+                sum(len(worker.bots) for worker in self.workers)
+            )
+        )
+        for worker in self.workers:
+            self.start_worker(worker)
+
+        last_report = time.monotonic()
+        while not all(worker.finished for worker in self.workers):
+            self.drain_reports(1)
+            self.check_workers()
+
+            now = time.monotonic()
+            if now - last_report >= self.REPORT_INTERVAL:
+                last_report = now
+                for line in self.health():
+                    self.log.info(line)
+                self.log.info(
+                    "Fleet throughput: %.1f packets/s"
+                    % self.total_packets_per_second()
+                )
+
+        for worker in self.workers:
+            worker.process.join()
+        self.log.info("All workers finished")
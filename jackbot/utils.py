@@ -9,3 +9,14 @@ def str_list_public(obj, padding: int = 8):
 def public_attributes(obj):
     d = obj.__dict__
     return [(k, d[k]) for k in d if not str.startswith(k, "__")]
+
+
+def import_object(path: str):
+    # Resolves "package.module:Attribute" the way entry points are written
+    import importlib
+
+    module_name, _, attribute = path.partition(":")
+    obj = importlib.import_module(module_name)
+    for name in filter(None, attribute.split(".")):
+        obj = getattr(obj, name)
+    return obj
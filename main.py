@@ -1,113 +1,189 @@
 import asyncio
-from math import prod
-import random
-import uuid
+from functools import partial
 import logging
+import os
 import sys
 
 from jackbot.api.http import HttpApiHandler
-from jackbot.api.http.v2_impl import V2HttpApiHandler
-from jackbot.api.wss import WssApiHandler
-from jackbot.context import JackboxGameContext
-from jackbot.player_info import PlayerInfo
+from jackbot.api.http.v2_impl import create_http_api
+from jackbot.answer_bank import AnswerBank
+from jackbot.fleet import BotEntry, JackboxFleet, load_manifest, play_bot
+from jackbot.generation import ModelBackend
+from jackbot.metrics import MetricsExporter
+from jackbot.orcale import AiTextOracle
 from jackbot.strategy import JackboxGameRegistry
-from jackbot.logging import create_game_logger, create_wss_api_logger
-from jackbot.room import try_find_room
-from jackbot.strategy.quiplash2 import Quiplash2Strategy
+from jackbot.supervisor import FleetSupervisor
 
 
-async def async_try_play_once(join_code: str, join_as: str):
-    logging.basicConfig()
-    main_logger = logging.getLogger(__name__)
-    main_logger.setLevel(logging.DEBUG)
-    main_logger.addHandler(logging.FileHandler("logs/main.log"))
-
-    api: HttpApiHandler = V2HttpApiHandler(main_logger)
+ANSWER_BANK_PATH = "./answers.bank"
 
-    # Probe for room first
-    probe, room = await try_find_room(api, join_code)
-    main_logger.debug(probe)
-    main_logger.debug(room)
-    if not probe.ok:
-        main_logger.info(
-            "Probe for room '%s' failed: %s" %
-            (join_code, probe.error)
-        )
-        return
 
-    # Setup
-    # Select client
-    app_tag = room.app_tag
-    game_info = JackboxGameRegistry().get_game_by_tag(app_tag)
-    if game_info is None:
-        main_logger.error("Unknown game! Known by tag '%s'" % app_tag)
-        return
+def setup_registry():
+    # Strategies are named in the file and imported once a game is joined
+    JackboxGameRegistry().load_from("./jackbox_games.json")
 
-    strategy_type = game_info.strategy_type
-    handler_type = game_info.handler_type
+    # Every worker maps the same read-only bank
+    if os.path.exists(ANSWER_BANK_PATH):
+        AnswerBank().load_from(ANSWER_BANK_PATH)
 
-    name_seq = [ord(c) for c in join_as]
-    name_seed = (prod(name_seq) - sum(name_seq)) * sum(name_seq)
 
-    uuid_node = uuid.getnode()
+def setup_oracle(
+    backend: str = None,
+    threads: str = None,
+    interop_threads: str = None,
+    preamble_path: str = None
+):
+    # Defaults for the oracle each process creates on first use
+    if backend is not None:
+        AiTextOracle.BACKEND = ModelBackend[backend.upper()]
+    if threads is not None:
+        AiTextOracle.TORCH_THREADS = int(threads)
+    if interop_threads is not None:
+        AiTextOracle.TORCH_INTEROP_THREADS = int(interop_threads)
+    if preamble_path is not None:
+        with open(preamble_path, "r") as f:
+            AiTextOracle.PREAMBLE = f.read()
 
-    rand = random.Random()
-    rand.seed(name_seed + uuid_node)
 
-    uuid_seq = rand.getrandbits(128)
-    uuid_gen = uuid.UUID(int=uuid_seq)
+def setup_process(oracle_options: dict):
+    setup_registry()
+    setup_oracle(**oracle_options)
 
-    this_uuid = uuid_gen.__str__()
-    main_logger.info(
-        "Assigned UUID: %s from seed produced from name: %i and node %i"
-        % (this_uuid, name_seed, uuid_node)
-    )
 
-    player_info = PlayerInfo()
-    player_info.name = join_as
-    player_info.uuid = this_uuid
-
-    game_logger = create_game_logger(
-        "logs/%s/" % (join_code),
-        "%s-%s" % (this_uuid, app_tag)
+def create_main_logger() -> logging.Logger:
+    logging.basicConfig()
+    main_logger = logging.getLogger(__name__)
+    main_logger.setLevel(logging.DEBUG)
+    main_logger.addHandler(logging.FileHandler("logs/main.log"))
+    return main_logger
+
+
+async def async_try_play_once(
+    join_code: str,
+    join_as: str,
+    ecast_host: str = None
+):
+    main_logger = create_main_logger()
+
+    api: HttpApiHandler = create_http_api(main_logger, ecast_host)
+    try:
+        await play_bot(BotEntry(join_code, join_as), api, main_logger)
+    finally:
+        await api.close()
+
+
+async def async_run_fleet(
+    manifest_path: str,
+    warm_up: bool = False,
+    exporter: MetricsExporter = None,
+    capture_path: str = None,
+    ecast_host: str = None
+):
+    main_logger = create_main_logger()
+
+    # All bots share one HTTP handler and, through its singleton, the oracle
+    api: HttpApiHandler = create_http_api(main_logger, ecast_host)
+    fleet = JackboxFleet(
+        load_manifest(manifest_path),
+        api,
+        main_logger,
+        warm_up,
+        capture_path
     )
-    wss_api_logger = create_wss_api_logger(
-        "logs/%s/" % (join_code),
-        "%s-%s" % (this_uuid, app_tag)
+    if exporter is not None:
+        await exporter.start()
+    try:
+        await fleet.run()
+    finally:
+        await api.close()
+        if exporter is not None:
+            await exporter.stop()
+
+
+def run_supervisor(
+    manifest_path: str,
+    workers: int = None,
+    warm_up: bool = False,
+    metrics_port: int = None,
+    metrics_dir: str = None,
+    ecast_host: str = None,
+    oracle_options: dict = None,
+    metrics_host: str = None
+):
+    main_logger = create_main_logger()
+
+    # Workers may be spawned rather than forked, so they set up again
+    supervisor = FleetSupervisor(
+        load_manifest(manifest_path),
+        main_logger,
+        workers,
+        partial(setup_process, oracle_options or {}),
+        warm_up=warm_up,
+        metrics_port=metrics_port,
+        metrics_dir=metrics_dir,
+        ecast_host=ecast_host,
+        metrics_host=metrics_host
     )
+    supervisor.run()
 
-    wss_api: WssApiHandler = handler_type(
-        wss_api_logger,
-        room.host,
-        room.code,
-        this_uuid
-    )
-    context = JackboxGameContext(
-        player_info,
-        wss_api,
-        game_logger
+if __name__ == "__main__":
+    # Options look like --warm-up or --metrics-port=9100
+    options = dict([
+        (arg[2:].split("=", 1) + [None])[:2]
+        for arg in sys.argv[1:]
+        if arg.startswith("--") and arg not in ("--fleet", "--supervise")
+    ])
+    argv = [
+        arg for arg in sys.argv
+        if not arg.startswith("--") or arg in ("--fleet", "--supervise")
+    ]
+    nargs = len(argv)
+
+    warm_up = "warm-up" in options
+    metrics_port = (
+        int(options["metrics-port"])
+        if options.get("metrics-port") is not None else
+        None
     )
-    context.set_strategy(strategy_type)
-
-    # Join?
-    result = await context.join(join_as)
-    if result:
-        # Joined, let's play
-        main_logger.info(
-            "Succesfully joined room '%s' to play '%s' as '%s'!"
-            % (join_code, game_info.name, join_as)
+    metrics_path = options.get("metrics-file")
+    # Served on 127.0.0.1 unless e.g. --metrics-host=0.0.0.0
+    metrics_host = options.get("metrics-host")
+    # Point at a local stand-in, e.g. --ecast=127.0.0.1:38000
+    ecast_host = options.get("ecast")
+    # Model settings, e.g. --backend=quantized --threads=4 --interop=1
+    # --preamble=prompts/preamble.txt
+    oracle_options = {
+        "backend": options.get("backend"),
+        "threads": options.get("threads"),
+        "interop_threads": options.get("interop"),
+        "preamble_path": options.get("preamble")
+    }
+
+    setup_process(oracle_options)
+
+    if argv[1] == "--fleet":
+        exporter = MetricsExporter(metrics_port, metrics_path, metrics_host)
+        asyncio.run(async_run_fleet(
+            argv[2],
+            warm_up,
+            exporter,
+            options.get("capture-dir"),
+            ecast_host
+        ))
+    elif argv[1] == "--supervise":
+        # Workers each export on port + worker id, or into a directory
+        workers = int(argv[3]) if nargs > 3 else None
+        run_supervisor(
+            argv[2],
+            workers,
+            warm_up,
+            metrics_port,
+            options.get("metrics-dir"),
+            ecast_host,
+            oracle_options,
+            metrics_host
         )
-        main_logger.info(f"Playing '{app_tag}' until finished...")
-        await context.play_until_finished()
     else:
-        # Couldn't join
-        main_logger.info("Join was not successful, going home.")
-
-if __name__ == "__main__":
-    nargs = len(sys.argv)
-    code = sys.argv[1]
-    name = sys.argv[2] if nargs >= 2 else "Pyamgos"
-
-    JackboxGameRegistry().load_from("./jackbox_games.json")
-    JackboxGameRegistry().register("quiplash2", Quiplash2Strategy)
-    asyncio.run(async_try_play_once(code, name))
+        code = argv[1]
+        name = argv[2] if nargs > 2 else "Pyamgos"
+        asyncio.run(async_try_play_once(code, name, ecast_host))
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import sys
+import time
+
+from jackbot.answer_bank import write_answer_bank
+from jackbot.answer_cache import cache_key
+from jackbot.orcale import AiTextOracle
+from jackbot.prompt import prompt_method
+
+
+async def precompute(oracle: AiTextOracle, prompt: str, n: int) -> list:
+    method = prompt_method(prompt)
+    # All answers are requested together so the oracle can batch them
+    answers = await asyncio.gather(*[
+        oracle.answer_with(method, prompt)
+        for _ in range(n)
+    ])
+    return list(dict.fromkeys([a for a in answers if len(a) > 0]))
+
+
+async def async_main(prompt_path: str, bank_path: str, n: int):
+    logging.basicConfig()
+    logger = logging.getLogger("precompute")
+    logger.setLevel(logging.INFO)
+
+    with open(prompt_path, "r") as f:
+        prompts = list(dict.fromkeys([
+            line.strip()
+            for line in f
+            if len(line.strip()) > 0
+        ]))
+
+    oracle = AiTextOracle(logger)
+    started = time.monotonic()
+    bank = {}
+    for i, prompt in enumerate(prompts):
+        answers = await precompute(oracle, prompt, n)
+        bank[cache_key(prompt_method(prompt), prompt)] = answers
+        logger.info(
+            "[%i/%i] %s -> %s" % (i + 1, len(prompts), prompt, answers)
+        )
+
+    write_answer_bank(bank_path, bank)
+    logger.info(
+        "Wrote %i prompts to '%s' in %.1fs"
+        % (len(bank), bank_path, time.monotonic() - started)
+    )
+    oracle.close()
+
+if __name__ == "__main__":
+    nargs = len(sys.argv)
+    prompt_path = sys.argv[1]
+    bank_path = sys.argv[2] if nargs > 2 else "answers.bank"
+    n = int(sys.argv[3]) if nargs > 3 else 8
+
+    asyncio.run(async_main(prompt_path, bank_path, n))
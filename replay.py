@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+
+from jackbot.answering import seed_answers
+from jackbot.api.wss.capture import Capture, read_capture
+from jackbot.api.wss.replay import ReplayWssApiHandler
+from jackbot.context import JackboxGameContext
+from jackbot.player_info import PlayerInfo
+from jackbot.strategy import JackboxGameRegistry
+from jackbot.strategy.quiplash2 import Quiplash2Strategy, VoteMode
+from main import setup_registry
+
+
+CANNED_ANSWERS = ["a soggy sock", "my landlord", "regret", "a tiny horse"]
+
+
+def find_prompts(value, prompts: list) -> None:
+    match value:
+        case dict():
+            for key, item in value.items():
+                if key == "prompt" and type(item) is str:
+                    prompts.append(item)
+                else:
+                    find_prompts(item, prompts)
+        case list():
+            for item in value:
+                find_prompts(item, prompts)
+
+
+def capture_prompts(capture: Capture) -> list:
+    prompts = []
+    for _, _, frame in capture.inbound():
+        find_prompts(json.loads(frame), prompts)
+    return list(dict.fromkeys(prompts))
+
+
+async def async_replay(
+    capture_path: str,
+    realtime: bool = False,
+    offline: bool = False,
+    seed: int = 0
+) -> dict:
+    logging.basicConfig()
+    log = logging.getLogger("replay")
+    log.setLevel(logging.INFO)
+
+    capture = read_capture(capture_path)
+    metadata = capture.metadata
+
+    if offline:
+        # Repeatable runs that measure the message pipeline alone: seeded
+        # random votes and canned answers, never the model
+        random.seed(seed)
+        Quiplash2Strategy.VOTE_MODE = VoteMode.RANDOM
+        await seed_answers(capture_prompts(capture), CANNED_ANSWERS)
+
+    app_tag = metadata.get("app_tag", JackboxGameRegistry.DEFAULT_CLIENT)
+    game_info = JackboxGameRegistry().get_game_by_tag(app_tag)
+    if game_info is None:
+        raise ValueError("Unknown game '%s' in capture" % app_tag)
+
+    player_info = PlayerInfo()
+    player_info.name = metadata.get("name", "Replay")
+    player_info.uuid = metadata.get("uuid")
+
+    api = ReplayWssApiHandler(log, capture, realtime)
+    context = JackboxGameContext(player_info, api, log)
+    context.set_strategy(game_info.strategy_type)
+
+    started = time.perf_counter()
+    if await context.join(player_info.name):
+        await context.play_until_finished()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "frames": api.packets_received,
+        "recorded_sends": len(capture.outbound()),
+        "sends": len(api.sent),
+        "elapsed": elapsed
+    }
+
+
+if __name__ == "__main__":
+    # python replay.py capture [--realtime] [--offline] [--seed=0]
+    options = dict([
+        (arg[2:].split("=", 1) + [None])[:2]
+        for arg in sys.argv[1:]
+        if arg.startswith("--")
+    ])
+    argv = [arg for arg in sys.argv if not arg.startswith("--")]
+
+    setup_registry()
+    result = asyncio.run(async_replay(
+        argv[1],
+        "realtime" in options,
+        "offline" in options,
+        int(options.get("seed") or 0)
+    ))
+    print(
+        "Replayed %i frames in %.3fs (%.0f frames/s), sent %i of %i "
+        "recorded actions" % (
+            result["frames"],
+            result["elapsed"],
+            result["frames"] / max(result["elapsed"], 1e-9),
+            result["sends"],
+            result["recorded_sends"]
+        )
+    )